@@ -1,13 +1,21 @@
 from __future__ import unicode_literals
-from .resampling_tests import calibrated_diptest, calibrated_bwtest, silverman_bwtest
-from .diptest import hartigan_diptest
+from .resampling_tests import calibrated_diptest, calibrated_bwtest, silverman_bwtest, \
+    calibrated_diptest_counts
+from .diptest import hartigan_diptest, hartigan_diptest_counts, hartigan_diptest_sketch, \
+    hartigan_diptest_columns, hartigan_diptest_subsets, WindowedDipMonitor
 from .excess_mass_modes import excess_mass_modes
+from .critical_bandwidth import ModeTree
+from .best_split import best_split
 from .flow_cytometry_interface import calibrated_diptest_fc,\
     calibrated_bwtest_fc, silverman_bwtest_fc, hartigan_diptest_fc,\
     excess_mass_modes_fc, preprocess_fcdata, infer_blur_delta
 
 __all__ = ['calibrated_diptest', 'calibrated_bwtest', 'silverman_bwtest',
            'hartigan_diptest', 'excess_mass_modes',
+           'calibrated_diptest_counts', 'hartigan_diptest_counts',
+           'hartigan_diptest_sketch', 'hartigan_diptest_columns',
+           'hartigan_diptest_subsets', 'WindowedDipMonitor', 'ModeTree',
+           'best_split',
            'calibrated_diptest_fc', 'calibrated_bwtest_fc',
            'silverman_bwtest_fc', 'hartigan_diptest_fc',
            'excess_mass_modes_fc', 'preprocess_fcdata', 'infer_blur_delta']
@@ -1,17 +1,22 @@
 from __future__ import unicode_literals
 import numpy as np
 from scipy.signal import argrelextrema
-from sklearn.neighbors import KernelDensity
 
 from .critical_bandwidth import critical_bandwidth_m_modes
+from .util import FastGaussTransformKDE
 
 
-def best_split(data, I=(-np.inf, np.inf)):
-    '''With bimodal data, finding split at lowest density.'''
-    h_crit = critical_bandwidth_m_modes(data, 2, I)
-    kde = KernelDensity(kernel='gaussian', bandwidth=h_crit).fit(data.reshape(-1, 1))
+def best_split(data, I=(-np.inf, np.inf), mode_tree=None):
+    '''With bimodal data, finding split at lowest density.
+       mode_tree is an optional ModeTree of data for the same I, from
+       which the critical bandwidth for two modes is taken.'''
+    if mode_tree is None:
+        h_crit = critical_bandwidth_m_modes(data, 2, I)
+    else:
+        h_crit = mode_tree.critical_bandwidth(2)
+    kde = FastGaussTransformKDE(data, h_crit)
     x = np.linspace(max(np.min(data), I[0]), min(np.max(data), I[1]), 200)
-    y = np.exp(kde.score_samples(x.reshape(-1, 1)))
+    y = kde.evaluate(x)
     modes = argrelextrema(np.hstack([[0], y, [0]]), np.greater)[0]
     if len(modes) != 2:
         raise ValueError("{} modes at: {}".format(len(modes), x[modes-1]))
@@ -20,6 +25,7 @@ def best_split(data, I=(-np.inf, np.inf)):
 
 if __name__ == '__main__':
     import matplotlib.pyplot as plt
+    from sklearn.neighbors import KernelDensity
     if 1:
         N = 1000
         data = np.hstack([np.random.randn(N/2), np.random.randn(N/4)+4])
@@ -1,8 +1,7 @@
 from __future__ import unicode_literals
 
-from mpi4py import MPI
-
 from ..util.bootstrap_MPI import probability_above
+from ..util.mpi_comm import comm_world
 
 
 class XSample(object):
@@ -11,9 +10,9 @@ class XSample(object):
         computes statistic.
     '''
 
-    def __init__(self, N, sampfun, comm=MPI.COMM_WORLD):
+    def __init__(self, N, sampfun, comm=None):
         self.N = N
-        self.comm = comm
+        self.comm = comm_world(comm)
         self.rank = self.comm.Get_rank()
         self.data = sampfun(N, self.comm)
 
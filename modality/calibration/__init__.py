@@ -1,5 +1,7 @@
 from __future__ import unicode_literals
 from .compute_calibration import compute_calibration
 from .lambda_alphas_access import print_computed_calibration
+from .dip_table import compute_dip_table, merge_dip_tables
 
-__all__ = ['compute_calibration', 'print_computed_calibration']
+__all__ = ['compute_calibration', 'print_computed_calibration',
+           'compute_dip_table', 'merge_dip_tables']
@@ -1,7 +1,6 @@
 from __future__ import unicode_literals
 from __future__ import print_function
 
-from mpi4py import MPI
 import numpy as np
 
 from .reference_sampfun import normalsamp, shouldersamp, binom_confidence_interval
@@ -10,22 +9,23 @@ from .bandwidth import XSampleBW
 from ..util.bootstrap_MPI import probability_in_interval
 from .lambda_alphas_access import save_lambda
 from ..util import print_rank0, print_all_ranks
+from ..util.mpi_comm import comm_world, comm_self
 
 
 def dip_scale_factor_adaptive(alpha, null='normal', lower_lambda=0, upper_lambda=2.0,
-                              comm=MPI.COMM_WORLD):
+                              comm=None):
     return calibration_scale_factor_adaptive(alpha, 'dip', null, lower_lambda,
                                              upper_lambda, comm)
 
 
 def bw_scale_factor_adaptive(alpha, null='normal', lower_lambda=0, upper_lambda=2.0,
-                             comm=MPI.COMM_WORLD):
+                             comm=None):
     return calibration_scale_factor_adaptive(alpha, 'bw', null, lower_lambda,
                                              upper_lambda, comm)
 
 
 def calibration_scale_factor_adaptive(alpha, type_, null='normal', lower_lambda=0, upper_lambda=2.0,
-                                      comm=MPI.COMM_WORLD, save_file=None):
+                                      comm=None, save_file=None):
     '''
         Computing (and saving) the dip scale factor lambda_alpha for a
         test calibrated at level alpha.
@@ -36,6 +36,7 @@ def calibration_scale_factor_adaptive(alpha, type_, null='normal', lower_lambda=
                                 bisection search.
     '''
 
+    comm = comm_world(comm)
     N_points = 10000
     rank = comm.Get_rank()
     nulldict = {'normal': normalsamp, 'shoulder': shouldersamp}
@@ -58,7 +59,7 @@ def calibration_scale_factor_adaptive(alpha, type_, null='normal', lower_lambda=
                 lambda_, 1-alpha),
             alpha_lower, alpha_upper, significance_first=significance_first,
             significance_second=significance_second,
-            comm=MPI.COMM_SELF, batch=20, print_per_batch=True)
+            comm=comm_self(), batch=20, print_per_batch=True)
         print_rank0(comm, "Rejection rate given lambda_val = {} is {}.".format(lambda_, res))
         return res
 
@@ -1,10 +1,7 @@
 from __future__ import unicode_literals
 from __future__ import print_function
 
-import matplotlib.pyplot as plt
-from mpi4py import MPI
 import numpy as np
-from sklearn.neighbors import KernelDensity
 from scipy.stats import binom
 
 from .XSample import XSample
@@ -13,18 +10,19 @@ from ..critical_bandwidth import is_unimodal_kde, critical_bandwidth
 from ..critical_bandwidth_fm import fisher_marron_critical_bandwidth, is_unimodal_kde as is_unimodal_kde_fm
 from ..shoulder_distributions import bump_distribution
 from ..util.bootstrap_MPI import probability_above
-from ..util import print_rank0, print_all_ranks
+from ..util import print_rank0, print_all_ranks, smoothed_bootstrap
+from ..util.mpi_comm import comm_world, comm_self
 
 
 class XSampleBW(XSample):
 
-    def __init__(self, N, sampfun, comm=MPI.COMM_WORLD):
+    def __init__(self, N, sampfun, comm=None):
         super(XSampleBW, self).__init__(N, sampfun, comm)
         self.I = (-1.5, 1.5)  # avoiding spurious bumps in the tails
         self.h_crit = critical_bandwidth(self.data, self.I)
         #print_all_ranks(self.comm, "self.h_crit = {}".format(self.h_crit))
         self.var = np.var(self.data)
-        self.kde_h_crit = KernelDensity(kernel='gaussian', bandwidth=self.h_crit).fit(self.data.reshape(-1, 1))
+        self.resampling_data = self.data  # smoothed bootstrap samples are drawn from this
 
     @property
     def statistic(self):
@@ -38,7 +36,7 @@ class XSampleBW(XSample):
         return self.is_unimodal_resample(lambda_scale)
 
     def is_unimodal_resample(self, lambda_val):
-        data = self.kde_h_crit.sample(self.N).reshape(-1)/np.sqrt(1+self.h_crit**2/self.var)
+        data = smoothed_bootstrap(self.resampling_data, self.h_crit, 1, self.N)[0]
         #print "np.var(data)/self.var = {}".format(np.var(data)/self.var)
         return is_unimodal_kde(self.h_crit*lambda_val, data, self.I)
 
@@ -50,7 +48,7 @@ class XSampleBW(XSample):
 
 class XSampleBwTrunc(XSampleBW):
 
-    def __init__(self, N, sampfun, range_, comm=MPI.COMM_WORLD, blur_func=None):
+    def __init__(self, N, sampfun, range_, comm=None, blur_func=None):
         super(XSampleBwTrunc, self).__init__(N, sampfun, comm)
         #self.data = self.data[(self.data > -3) & (self.data < 3)]
         #print "nbr removed: {}".format(N-len(self.data))
@@ -65,7 +63,7 @@ class XSampleBwTrunc(XSampleBW):
         self.I = [(i+3)*self.range_*1./6 for i in I]
         self.h_crit = critical_bandwidth(self.data, self.I)
         self.var = np.var(self.data)
-        self.kde_h_crit = KernelDensity(kernel='gaussian', bandwidth=self.h_crit).fit(self.data.reshape(-1, 1))
+        self.resampling_data = self.data
         self.data = self.blur_func(self.data)      
 
     # def is_unimodal_resample(self, lambda_val):
@@ -79,8 +77,8 @@ class XSampleShoulderBW(XSampleBW):
         Obsolete, use XSampleBW with sampfun='shoulder' instead.
     '''
 
-    def __init__(self, N, comm=MPI.COMM_SELF):
-        self.comm = comm
+    def __init__(self, N, comm=None):
+        self.comm = comm_self(comm)
         self.rank = self.comm.Get_rank()
         self.I = (-1.5, 1.5)  # CHECK: Is appropriate bound? OK.
         self.N = N
@@ -98,7 +96,7 @@ class XSampleShoulderBW(XSampleBW):
         self.var = np.var(data)
         self.h_crit = critical_bandwidth(data, self.I)
         #print_all_ranks(self.comm, "self.h_crit = {}".format(self.h_crit))
-        self.kde_h_crit = KernelDensity(kernel='gaussian', bandwidth=self.h_crit).fit(data.reshape(-1, 1))
+        self.resampling_data = data
 
 
 def get_fm_sampling_class(mtol):
@@ -107,8 +105,8 @@ def get_fm_sampling_class(mtol):
 
     class XSampleFMBW(XSampleBW):
 
-        def __init__(self, N, comm=MPI.COMM_SELF):
-            self.comm = comm
+        def __init__(self, N, comm=None):
+            self.comm = comm_self(comm)
             self.rank = self.comm.Get_rank()
             self.I = (-1.5, a+1)  # CHECK: Is appropriate bound? OK.
             self.lamtol = 0
@@ -126,10 +124,10 @@ def get_fm_sampling_class(mtol):
             self.var = np.var(data)
             self.h_crit = fisher_marron_critical_bandwidth(data, self.lamtol, self.mtol, self.I)
             #print_all_ranks(self.comm, "self.h_crit = {}".format(self.h_crit))
-            self.kde_h_crit = KernelDensity(kernel='gaussian', bandwidth=self.h_crit).fit(data.reshape(-1, 1))
+            self.resampling_data = data
 
         def is_unimodal_resample(self, lambda_val):
-            data = self.kde_h_crit.sample(self.N).reshape(-1)/np.sqrt(1+self.h_crit**2/self.var)
+            data = smoothed_bootstrap(self.resampling_data, self.h_crit, 1, self.N)[0]
             #print "np.var(data)/self.var = {}".format(np.var(data)/self.var)
             return is_unimodal_kde_fm(self.h_crit*lambda_val, data, self.lamtol, self.mtol, self.I)
 
@@ -157,8 +155,9 @@ def get_sampling_class(null, **kwargs):
 
 
 def h_crit_scale_factor(alpha, null='normal', lower_lambda=0, upper_lambda=2.0,
-                        comm=MPI.COMM_WORLD, save_file=None, **samp_class_args):
+                        comm=None, save_file=None, **samp_class_args):
 
+    comm = comm_world(comm)
     rank = comm.Get_rank()
     sampling_class = get_sampling_class(null, **samp_class_args)
 
@@ -180,7 +179,7 @@ def h_crit_scale_factor(alpha, null='normal', lower_lambda=0, upper_lambda=2.0,
         '''
         return probability_above(
             lambda: sampling_class(N, comm=comm).probability_of_unimodal_above(
-                lambda_val, 1-alpha), alpha, comm=MPI.COMM_SELF, batch=10, tol=0.005, print_per_batch=True)  # 0.005)
+                lambda_val, 1-alpha), alpha, comm=comm_self(), batch=10, tol=0.005, print_per_batch=True)  # 0.005)
 
     def save_upper(lambda_bound):
         if null == 'fm':
@@ -228,6 +227,8 @@ def h_crit_scale_factor(alpha, null='normal', lower_lambda=0, upper_lambda=2.0,
 
 
 if __name__ == '__main__':
+    import matplotlib.pyplot as plt
+    from sklearn.neighbors import KernelDensity
     if 0:
         print("h_crit_scale_factor(0.30, 0, 2.0) = {}".format(h_crit_scale_factor(0.30, 0, 2.0)))  # alpha=0.05 => lambda_alpha=1.12734985352
 
@@ -239,7 +240,8 @@ if __name__ == '__main__':
         xsamp = XSampleShoulderBW(10000)
         x = np.linspace(-2, 2, 200)
         fig, ax = plt.subplots()
-        ax.plot(x, np.exp(xsamp.kde_h_crit.score_samples(x.reshape(-1, 1))))
+        kde_h_crit = KernelDensity(kernel='gaussian', bandwidth=xsamp.h_crit).fit(xsamp.data.reshape(-1, 1))
+        ax.plot(x, np.exp(kde_h_crit.score_samples(x.reshape(-1, 1))))
         ax.axvline(-1.5)
         ax.axvline(1.5)
         kde_h = KernelDensity(kernel='gaussian', bandwidth=xsamp.h_crit*0.8).fit(xsamp.data.reshape(-1, 1))
@@ -1,14 +1,13 @@
 from __future__ import unicode_literals
 
-from mpi4py import MPI
-
 from .adaptive_calibration import calibration_scale_factor_adaptive
 from .dip import dip_scale_factor
 from .bandwidth import h_crit_scale_factor
+from ..util.mpi_comm import comm_world
 
 
 def compute_calibration(calibration_file, test, null, alpha, adaptive=True,
-                        lower_lambda=0, upper_lambda=2.0, comm=MPI.COMM_WORLD):
+                        lower_lambda=0, upper_lambda=2.0, comm=None):
     '''
         Compute calibration constant lambda_alpha and save to file
         'calibration_file'.
@@ -24,8 +23,10 @@ def compute_calibration(calibration_file, test, null, alpha, adaptive=True,
                                 bisection search.
             upper_lambda    -   upper bound for lambda_alpha in
                                 bisection search.
-            comm            -   MPI communicator.
+            comm            -   MPI communicator, MPI.COMM_WORLD
+                                if None.
     '''
+    comm = comm_world(comm)
 
     if comm.Get_rank() == 0:
         try:
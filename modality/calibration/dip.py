@@ -1,9 +1,7 @@
 from __future__ import unicode_literals
 from __future__ import print_function
 
-from mpi4py import MPI
 import numpy as np
-import matplotlib.pyplot as plt
 
 from .XSample import XSample
 from .reference_sampfun import normalsamp, shouldersamp
@@ -11,6 +9,7 @@ from ..diptest import cum_distr, dip_and_closest_unimodal_from_cdf, dip_from_cdf
 from ..util.bootstrap_MPI import bootstrap, bootstrap_array, probability_above
 from .lambda_alphas_access import save_lambda
 from ..util import print_rank0, print_all_ranks, fp_blurring
+from ..util.mpi_comm import comm_world, comm_self
 
 
 class XSampleDip(XSample):
@@ -20,7 +19,7 @@ class XSampleDip(XSample):
         data from the closest unimodal distribution can be sampled.
     '''
 
-    def __init__(self, N, sampfun, comm=MPI.COMM_WORLD):
+    def __init__(self, N, sampfun, comm=None):
         super(XSampleDip, self).__init__(N, sampfun, comm)
 
     @property
@@ -88,12 +87,13 @@ class XSampleDip(XSample):
         return self.prob_resampled_statistic_below_bound_above_gamma(lambda_scale, gamma)
 
     def plot_unimodal(self):
+        import matplotlib.pyplot as plt
         plt.plot(*self.unimod)
 
 
 class XSampleDipTrunc(XSampleDip):
 
-    def __init__(self, N, sampfun, range_, comm=MPI.COMM_WORLD, blur_func=None):
+    def __init__(self, N, sampfun, range_, comm=None, blur_func=None):
         super(XSampleDipTrunc, self).__init__(N, sampfun, comm)
         #self.data = self.data[(self.data > -3) & (self.data < 3)]
         #print "nbr removed: {}".format(N-len(self.data))
@@ -114,8 +114,9 @@ class XSampleDipTrunc(XSampleDip):
 
 
 def dip_scale_factor(alpha, null='normal', lower_lambda=0, upper_lambda=2.0,
-                     comm=MPI.COMM_WORLD, save_file=None):
+                     comm=None, save_file=None):
 
+    comm = comm_world(comm)
     rank = comm.Get_rank()
     sampfun = normalsamp if null == 'normal' else shouldersamp
 
@@ -137,7 +138,7 @@ def dip_scale_factor(alpha, null='normal', lower_lambda=0, upper_lambda=2.0,
         '''
         return probability_above(
             lambda: XSampleDip(N, sampfun, comm=comm).prob_resampled_dip_below_bound_above_gamma(
-                lambda_val, 1-alpha), alpha, comm=MPI.COMM_SELF, batch=20, tol=0, print_per_batch=True)  # 0.005)
+                lambda_val, 1-alpha), alpha, comm=comm_self(), batch=20, tol=0, print_per_batch=True)  # 0.005)
 
     def save_upper(lambda_bound):
         save_lambda(lambda_bound, 'dip_ex', null, alpha, upper=True, lambda_file=save_file)
@@ -154,7 +155,7 @@ def dip_scale_factor(alpha, null='normal', lower_lambda=0, upper_lambda=2.0,
     #seed = 846
     #seeds = [1013, 225, 603, 112, 952, 870, 869, 394, 986, 458, 685, 438, 74,
     #         671, 356, 255, 241, 802, 339, 193]
-    #sseed = seeds[MPI.COMM_WORLD.Get_rank()]
+    #sseed = seeds[comm_world().Get_rank()]
     print_all_ranks(comm, "seed = {}".format(seed))
     np.random.seed(seed)
 
@@ -188,10 +189,11 @@ def dip_scale_factor_approx(alphas, sampfun, B=1000, N=10000):
 
 
 if __name__ == '__main__':
+    import matplotlib.pyplot as plt
     #seed = np.random.randint(1000)
     import time
     seed = 123  # 411
-    rank = MPI.COMM_WORLD.Get_rank()
+    rank = comm_world().Get_rank()
     print("seed = {} at rank {}".format(seed+rank, rank))
     np.random.seed(seed+rank)
     if 0:
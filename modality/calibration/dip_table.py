@@ -0,0 +1,217 @@
+'''
+    Simulation of quantiles of the dip under the null hypothesis, to
+    tabulate p-values for Hartigan's dip test at numbers of
+    observations beyond the table from the R package diptest.
+
+    Dips are computed for samples from the uniform distribution (the
+    least favourable unimodal distribution) with the dip engines in
+    modality.diptest. The work is split into chunks of dips that are
+    computed either with MPI or with a pool of processes, and the dips
+    computed so far can be saved to a checkpoint file from which an
+    interrupted computation is resumed.
+'''
+from __future__ import unicode_literals
+from __future__ import division
+from __future__ import print_function
+
+import multiprocessing
+import os
+import time
+
+import numpy as np
+
+from ..diptest import dip_batch, save_dip_table
+
+default_ps = np.array([0, 0.01, 0.02, 0.05, 0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7,
+                       0.8, 0.9, 0.95, 0.98, 0.99, 0.995, 0.998, 0.999, 1])
+
+
+def compute_dip_table(Ns, table_file=None, B=10000, ps=default_ps,
+                      checkpoint_file=None, comm=None, n_jobs=1, chunk=100,
+                      engine='hull', seed=None, checkpoint_interval=60,
+                      max_points=10**6):
+    '''
+        Simulate B dips of uniform samples for each number of
+        observations in Ns and tabulate their ps-quantiles. The table
+        can be used with diptest.DipPvalInterpolator, e.g. as
+            DipPvalInterpolator(*load_dip_table(table_file))
+        possibly after combining it with the tabulated values from R
+        with merge_dip_tables.
+
+        Input:
+            Ns                  -   numbers of observations (increasing).
+            table_file          -   if not None, the table is saved to
+                                    this file with diptest.save_dip_table.
+            B                   -   number of simulated dips per N.
+            ps                  -   probabilities of the quantiles.
+            checkpoint_file     -   if not None, dips computed so far are
+                                    saved to this file (at most every
+                                    checkpoint_interval seconds). If the
+                                    file exists, the computation is
+                                    resumed from it, with the seed
+                                    saved in it.
+            comm                -   MPI communicator. If None, MPI is not
+                                    used and the dips are computed by a
+                                    pool of n_jobs processes.
+            n_jobs              -   number of processes if comm is None.
+            chunk               -   number of dips per task.
+            engine              -   dip engine (see diptest.dip_engines).
+            seed                -   seed for the random numbers. For a
+                                    given seed the dips do not depend
+                                    on comm, n_jobs or checkpointing.
+            checkpoint_interval -   minimum time in seconds between
+                                    checkpoints.
+            max_points          -   maximal number of points sampled at
+                                    once by a process.
+
+        Value:
+            (Ns, ps, diptable), diptable[i, j] is the ps[j]-quantile of
+            the dip for Ns[i] observations.
+    '''
+    Ns = np.asarray(Ns, dtype=np.int64)
+    ps = np.asarray(ps, dtype=np.float64)
+    if np.any(np.diff(Ns) <= 0):
+        raise ValueError('Ns must be increasing')
+    nbr_chunks = int(np.ceil(B/chunk))
+    rank = 0 if comm is None else comm.Get_rank()
+
+    if rank == 0:
+        if checkpoint_file is not None and os.path.exists(checkpoint_file):
+            seed, dips, done = load_checkpoint(checkpoint_file, Ns, B, chunk)
+        else:
+            if seed is None:
+                seed = np.random.randint(2**31)
+            dips = np.full((len(Ns), B), np.nan)
+            done = np.zeros((len(Ns), nbr_chunks), dtype=np.bool_)
+        tasks = [(Ns[i], min(chunk, B-j*chunk), (seed, i, j), engine, max_points)
+                 for i, j in zip(*np.nonzero(~done))]
+    else:
+        tasks = None
+    if comm is not None:
+        tasks = comm.bcast(tasks)
+
+    t_checkpoint = time.time()
+    for task, dips_task in _map_tasks(simulate_dips, tasks, comm, n_jobs):
+        _, i, j = task[2]
+        dips[i, j*chunk:(j*chunk+len(dips_task))] = dips_task
+        done[i, j] = True
+        if checkpoint_file is not None and time.time()-t_checkpoint > checkpoint_interval:
+            save_checkpoint(checkpoint_file, Ns, B, chunk, seed, dips, done)
+            print("Checkpoint saved: {} of {} chunks of dips computed".format(
+                np.sum(done), done.size))
+            t_checkpoint = time.time()
+
+    if rank == 0:
+        if checkpoint_file is not None:
+            save_checkpoint(checkpoint_file, Ns, B, chunk, seed, dips, done)
+        diptable = np.percentile(dips, 100*ps, axis=1).T
+        if table_file is not None:
+            save_dip_table(table_file, Ns, ps, diptable)
+    else:
+        diptable = None
+    if comm is not None:
+        diptable = comm.bcast(diptable)
+    return Ns, ps, diptable
+
+
+def simulate_dips(task):
+    '''
+        Dips of n uniform samples of size N.
+
+        Input:
+            task    -   (N, n, seed, engine, max_points). seed is
+                        passed to np.random.RandomState, at most
+                        max_points points are sampled at once.
+    '''
+    N, n, seed, engine, max_points = task
+    random_state = np.random.RandomState(seed)
+    batch = max(1, max_points//N)
+    dips = np.empty(n)
+    for k in range(0, n, batch):
+        m = min(batch, n-k)
+        dips[k:(k+m)] = dip_batch(sorted_uniform_samples(N, m, random_state),
+                                  engine, is_sorted=True)
+    return dips
+
+
+def sorted_uniform_samples(N, B, random_state=np.random):
+    '''
+        B sorted samples (rows) of size N from the uniform distribution
+        on [0, 1], as cumulative sums of N+1 exponential spacings
+        divided by their total.
+    '''
+    samples = np.cumsum(random_state.standard_exponential((B, N+1)), axis=1)
+    return samples[:, :-1]/samples[:, -1:]
+
+
+def merge_dip_tables(*tables):
+    '''
+        Merge tables (Ns, ps, diptable) with the same probabilities ps
+        into one table with increasing Ns. For N in more than one
+        table, the row from the first of these tables is kept, e.g.
+            merge_dip_tables(load_dip_table(qDiptab_npy_file),
+                             load_dip_table(table_file))
+        extends the table from R with simulated quantiles.
+    '''
+    ps = np.asarray(tables[0][1], dtype=np.float64)
+    for table in tables[1:]:
+        if not np.array_equal(np.asarray(table[1], dtype=np.float64), ps):
+            raise ValueError('Tables with different probabilities cannot be merged')
+    Ns = np.hstack([table[0] for table in tables])
+    diptable = np.vstack([table[2] for table in tables])
+    Ns, ind = np.unique(Ns, return_index=True)
+    return Ns, ps, diptable[ind, :]
+
+
+def save_checkpoint(checkpoint_file, Ns, B, chunk, seed, dips, done):
+    tmp_file = checkpoint_file+'.tmp'
+    with open(tmp_file, 'wb') as f:
+        np.savez(f, Ns=Ns, B=B, chunk=chunk, seed=seed, dips=dips, done=done)
+    try:
+        os.replace(tmp_file, checkpoint_file)
+    except AttributeError:  # Python 2
+        if os.path.exists(checkpoint_file):
+            os.remove(checkpoint_file)
+        os.rename(tmp_file, checkpoint_file)
+
+
+def load_checkpoint(checkpoint_file, Ns, B, chunk):
+    '''
+        Value:
+            (seed, dips, done) saved with save_checkpoint.
+    '''
+    with np.load(checkpoint_file) as checkpoint:
+        if not (np.array_equal(checkpoint['Ns'], Ns) and checkpoint['B'] == B
+                and checkpoint['chunk'] == chunk):
+            raise ValueError('Checkpoint {} was computed for other Ns, B or '
+                             'chunk'.format(checkpoint_file))
+        return int(checkpoint['seed']), checkpoint['dips'], checkpoint['done']
+
+
+def _map_tasks(fun, tasks, comm, n_jobs):
+    '''
+        Yields (task, fun(task)) for all tasks, computed by the workers
+        of comm (results only yielded at rank 0) or, if comm is None,
+        by a pool of n_jobs processes.
+    '''
+    if comm is not None:
+        rank = comm.Get_rank()
+        size = comm.Get_size()
+        for start in range(0, len(tasks), size):
+            tasks_round = tasks[start:(start+size)]
+            res = fun(tasks_round[rank]) if rank < len(tasks_round) else None
+            res = comm.gather(res)
+            if rank == 0:
+                for task, res_task in zip(tasks_round, res):
+                    yield task, res_task
+    elif n_jobs == 1:
+        for task in tasks:
+            yield task, fun(task)
+    else:
+        pool = multiprocessing.Pool(n_jobs)
+        try:
+            for task, res_task in zip(tasks, pool.imap(fun, tasks)):
+                yield task, res_task
+            pool.close()
+        finally:
+            pool.terminate()
@@ -6,13 +6,14 @@ try:
 except ImportError:
     import pickle
 
-from mpi4py import MPI
+import os
+
 import numpy as np
-import pkg_resources
 
-lambda_file_precomputed = \
-    pkg_resources.resource_filename('modality.calibration',
-                                    'data/lambda_alphas.pkl')
+from ..util.mpi_comm import comm_world
+
+lambda_file_precomputed = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), 'data', 'lambda_alphas.pkl')
 
 
 def load_lambdas(test, null, alpha, lambda_file=None):
@@ -45,10 +46,10 @@ def load_lambda_lower(test, null, alpha, lambda_file=None):
 
 
 def save_lambda(lambda_val, test, null, alpha, upper=None, lambda_file=None):
-    if lambda_file is 'precomputed':
+    if lambda_file == 'precomputed':
         lambda_file = lambda_file_precomputed
 
-    if MPI.COMM_WORLD.Get_rank() == 0:
+    if comm_world().Get_rank() == 0:
 
         try:
             with open(lambda_file, 'rb') as f:
@@ -79,7 +80,8 @@ def save_lambda(lambda_val, test, null, alpha, upper=None, lambda_file=None):
             lambda_val, 'upper' if upper else 'lower', test, null, alpha))
 
 
-def print_computed_calibration(lambda_file=None, include_dip_approx=False, comm=MPI.COMM_WORLD):
+def print_computed_calibration(lambda_file=None, include_dip_approx=False, comm=None):
+    comm = comm_world(comm)
     if comm.Get_rank() == 0:
         if lambda_file is None:
             lambda_file = lambda_file_precomputed
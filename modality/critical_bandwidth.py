@@ -1,35 +1,54 @@
 from __future__ import unicode_literals
 from __future__ import print_function
 
-import matplotlib.pyplot as plt
 import numpy as np
-from scipy.signal import argrelextrema
+from scipy.signal import argrelextrema, fftconvolve
 
 from .util import ApproxGaussianKDE as KDE
+from .util import TruncatedGaussianKDE, FFTGaussianKDE, FastGaussTransformKDE
+from .util import BinningPyramid
 
+# Kernel density estimators used for mode counting. They are
+# constructed as kde_engines[engine](data, h) and must provide
+# evaluate_prop, _norm_factor and distr.
+kde_engines = {'binned': KDE,  # binned data, direct summation
+               'truncated': TruncatedGaussianKDE,  # summation within cutoff only
+               'fft': FFTGaussianKDE,  # linear binning on grid, FFT convolution
+               'fgt': FastGaussTransformKDE}  # fast Gauss transform
 
-def critical_bandwidth(data, I=(-np.inf, np.inf), htol=1e-3):
+
+def get_kde_engine(engine):
+    try:
+        return kde_engines[engine]
+    except KeyError:
+        raise ValueError('Unknown KDE engine: {}'.format(engine))
+
+
+def critical_bandwidth(data, I=(-np.inf, np.inf), htol=1e-3, kde_engine='binned'):
     '''
     I is interval over which density is tested for unimodality
     '''
     hmax = (np.max(data)-np.min(data))/2.0
-    return bisection_search_unimodal(0, hmax, htol, data, I)
+    return bisection_search_unimodal(0, hmax, htol, data, I, kde_engine,
+                                     BinningPyramid(data))
 
 
-def critical_bandwidth_m_modes(data, m, I=(-np.inf, np.inf), htol=1e-3):
+def critical_bandwidth_m_modes(data, m, I=(-np.inf, np.inf), htol=1e-3, kde_engine='binned'):
         # I is interval over which density is tested for unimodality
     hmax = (np.max(data)-np.min(data))/2.0
-    return bisection_search_most_m_modes(0, hmax, htol, data, m, I)
+    return bisection_search_most_m_modes(0, hmax, htol, data, m, I, kde_engine,
+                                         BinningPyramid(data))
 
 
-def bisection_search_unimodal(hmin, hmax, htol, data, I):
+def bisection_search_unimodal(hmin, hmax, htol, data, I, kde_engine='binned', pyramid=None):
     '''
     Assuming fun(xmax) < 0.
     '''
-    return bisection_search_most_m_modes(hmin, hmax, htol, data, 1, I)
+    return bisection_search_most_m_modes(hmin, hmax, htol, data, 1, I, kde_engine, pyramid)
 
 
-def bisection_search_most_m_modes(hmin, hmax, htol, data, m, I):
+def bisection_search_most_m_modes(hmin, hmax, htol, data, m, I, kde_engine='binned',
+                                  pyramid=None):
     '''
     Assuming fun(xmax) < 0.
     '''
@@ -37,20 +56,28 @@ def bisection_search_most_m_modes(hmin, hmax, htol, data, m, I):
         return (hmin + hmax)/2.0
     hnew = (hmin + hmax)/2.0
     #print "hnew = {}".format(hnew)
-    if kde_has_at_most_m_modes(hnew, data, m, I):  # upper bound for bandwidth
-        return bisection_search_most_m_modes(hmin, hnew, htol, data, m, I)
-    return bisection_search_most_m_modes(hnew, hmax, htol, data, m, I)
+    if kde_has_at_most_m_modes(hnew, data, m, I, kde_engine, pyramid):  # upper bound for bandwidth
+        return bisection_search_most_m_modes(hmin, hnew, htol, data, m, I, kde_engine, pyramid)
+    return bisection_search_most_m_modes(hnew, hmax, htol, data, m, I, kde_engine, pyramid)
 
 
-def is_unimodal_kde(h, data, I=(-np.inf, np.inf)):
-    return kde_has_at_most_m_modes(h, data, 1, I)
+def is_unimodal_kde(h, data, I=(-np.inf, np.inf), kde_engine='binned', pyramid=None):
+    return kde_has_at_most_m_modes(h, data, 1, I, kde_engine, pyramid)
 
 
-def kde_has_at_most_m_modes(h, data, m, I=(-np.inf, np.inf)):
+def kde_has_at_most_m_modes(h, data, m, I=(-np.inf, np.inf), kde_engine='binned',
+                            pyramid=None):
     # I is interval over which density is tested for unimodality
+    # kde_engine is 'binned', 'truncated', 'fft' or 'fgt', see kde_engines
+    # pyramid is a BinningPyramid of data, from which the KDE is formed
+    # without binning data again
     xtol = h*0.05  # TODO: Compute error given xtol.
-    kde = KDE(data, h)
-    x_new = np.linspace(max(I[0], np.min(data)), min(I[1], np.max(data)), 10)
+    if pyramid is None:
+        kde = get_kde_engine(kde_engine)(data, h)
+        x_new = np.linspace(max(I[0], np.min(data)), min(I[1], np.max(data)), 10)
+    else:
+        kde = get_kde_engine(kde_engine).from_pyramid(pyramid, h)
+        x_new = np.linspace(max(I[0], pyramid.min), min(I[1], pyramid.max), 10)
     x = np.zeros(0,)
     y = np.zeros(0,)
     while True:
@@ -68,6 +95,335 @@ def kde_has_at_most_m_modes(h, data, m, I=(-np.inf, np.inf)):
         x_new = (x[:-1]+x[1:])/2.0
 
 
+def is_unimodal_kde_batch(h, data, I=(-np.inf, np.inf), tol=1e-4):
+    return kde_has_at_most_m_modes_batch(h, data, 1, I, tol)
+
+
+def kde_has_at_most_m_modes_batch(h, data, m, I=(-np.inf, np.inf), tol=1e-4):
+    '''
+        kde_has_at_most_m_modes for each row of a two-dimensional array,
+        e.g. B smoothed bootstrap samples of size N, which are tested
+        together.
+
+        Since h and I are the same for all rows, they share one grid
+        with spacing sqrt(2*tol)*h covering I (or the range of the data)
+        and the kernel cutoff, as in FFTGaussianKDE. All rows are
+        linearly binned on the grid with one two-dimensional histogram
+        (a bincount over row and grid index) and convolved with the
+        sampled kernel together. Data further than the cutoff from
+        the grid covering I does not contribute to the KDE there and is
+        dropped. Modes of each row are counted as local maxima on the
+        grid between max(I[0], min(row)) and min(I[1], max(row)), with
+        values outside set to zero, as in kde_has_at_most_m_modes.
+
+        Input:
+            h       -   bandwidth.
+            data    -   B x N array.
+            m       -   maximal number of modes.
+            I       -   interval in which modes are counted.
+            tol     -   error tolerance, as for FFTGaussianKDE.
+
+        Value:
+            Boolean array of length B.
+    '''
+    data = np.atleast_2d(data)
+    row_min = np.min(data, axis=1)
+    row_max = np.max(data, axis=1)
+    lower = np.maximum(I[0], row_min)
+    upper = np.minimum(I[1], row_max)
+    dx = np.sqrt(2*tol)*h
+    nbr_kernel = int(np.ceil(np.sqrt(-2*np.log(tol/2))*h/dx))
+    x0 = np.min(lower) - nbr_kernel*dx
+    nbr_grid = int(np.ceil((np.max(upper)-x0)/dx)) + nbr_kernel + 2
+    grid = x0 + np.arange(nbr_grid)*dx
+    kernel = np.exp(-(np.arange(-nbr_kernel, nbr_kernel+1)*dx/h)**2/2.0)
+
+    res = np.zeros(len(data), dtype=np.bool_)
+    batch = max(1, 2**22//nbr_grid)
+    for start in range(0, len(data), batch):
+        rows = slice(start, start+batch)
+        data_ = data[rows]
+        B = len(data_)
+        pos = (data_-x0)/dx
+        ind = np.floor(pos).astype(np.int64)
+        frac = pos - ind
+        inside = (ind >= 0) & (ind < nbr_grid-1)
+        ind = (ind + nbr_grid*np.arange(B).reshape(-1, 1))[inside]
+        frac = frac[inside]
+        grid_weights = (np.bincount(ind, 1-frac, minlength=B*nbr_grid) +
+                        np.bincount(ind+1, frac, minlength=B*nbr_grid)).reshape(B, nbr_grid)
+        y = fftconvolve(grid_weights, kernel[np.newaxis, :], mode='same', axes=1)
+        y[y < 1e-10*data.shape[1]] = 0
+        y[(grid < lower[rows, np.newaxis]) | (grid > upper[rows, np.newaxis])] = 0
+        y = np.hstack([np.zeros((B, 1)), y, np.zeros((B, 1))])
+        is_max = (y[:, 1:-1] > y[:, :-2]) & (y[:, 1:-1] > y[:, 2:])
+        res[rows] = np.sum(is_max, axis=1) <= m
+    return res
+
+
+class ModeTree(object):
+    '''
+        Number of modes in I of the Gaussian kernel density estimate of
+        data as a function of the bandwidth h (the mode tree), from which
+        the critical bandwidth for m modes is obtained for every m, so
+        that one object can serve the Silverman test, the calibrated
+        bandwidth test and best_split on the same data.
+
+        The data is linearly binned once on a regular grid and the FFT of
+        the binned data is computed once. The KDE for a bandwidth h is
+        then the inverse FFT of its product with the Fourier transform of
+        the kernel, exp(-(omega*h)**2/2), and the KDEs for many bandwidths
+        are evaluated together in one batched inverse FFT. Modes are
+        counted as local maxima on the grid.
+
+        The grid extends the kernel cutoff for the largest bandwidth
+        hmax = (max(data)-min(data))/2 beyond the data, so that the
+        periodic convolution has the error bound of FFTGaussianKDE for
+        h >= h_min = dx/sqrt(2*tol), where dx is the grid spacing. Mode
+        counts are computed for a geometric ladder of bandwidths from
+        h_min to hmax. The critical bandwidth for m modes is bracketed by
+        the ladder and then found by bisection to htol, for all requested
+        m in the same inverse FFTs. If the KDE has at most m modes
+        already at h_min, bisection_search_most_m_modes is used below
+        h_min.
+
+        Input:
+            data        -   one-dimensional data set.
+            I           -   interval in which modes are counted.
+            htol        -   tolerance for critical bandwidths.
+            nbr_levels  -   number of bandwidths in the ladder.
+            nbr_grid    -   number of grid points.
+            tol         -   error tolerance, as for FFTGaussianKDE.
+    '''
+
+    def __init__(self, data, I=(-np.inf, np.inf), htol=1e-3, nbr_levels=32,
+                 nbr_grid=2**16, tol=1e-4):
+        self.data = np.asarray(data, dtype=np.float64).ravel()
+        self.I = I
+        self.htol = htol
+        self.nbr_grid = nbr_grid
+        self.data_min, self.data_max = np.min(self.data), np.max(self.data)
+        self.hmax = (self.data_max-self.data_min)/2.0
+        if self.hmax == 0:
+            raise ValueError('Mode tree for data with zero range')
+        cutoff = np.sqrt(-2*np.log(tol/2))
+        self.dx = (self.data_max-self.data_min+2*cutoff*self.hmax)/(nbr_grid-2)
+        self.h_min = min(self.dx/np.sqrt(2*tol), self.hmax)
+        x0 = self.data_min - cutoff*self.hmax
+        self.grid = x0 + np.arange(nbr_grid)*self.dx
+
+        pos = (self.data-x0)/self.dx
+        ind = np.floor(pos).astype(np.int64)
+        frac = pos - ind
+        grid_weights = (np.bincount(ind, 1-frac, minlength=nbr_grid) +
+                        np.bincount(ind+1, frac, minlength=nbr_grid))
+        self._data_fft = np.fft.rfft(grid_weights)
+        self._omega = 2*np.pi*np.fft.rfftfreq(nbr_grid, self.dx)
+        self._inside = np.nonzero((self.grid >= max(I[0], self.data_min)) &
+                                  (self.grid <= min(I[1], self.data_max)))[0]
+        self._pyramid = None
+        self._h_crit = {}
+
+        self.bandwidths = np.exp(np.linspace(np.log(self.h_min), np.log(self.hmax), nbr_levels))
+        self.mode_counts = self.nbr_modes(self.bandwidths)
+
+    def evaluate_prop(self, h):
+        '''
+            Values proportional to the KDE for each bandwidth in h
+            (rows) at the grid points in I (self.grid[self._inside]).
+        '''
+        h = np.asarray(h, dtype=np.float64)
+        kernel_fft = np.exp(-(self._omega*h.reshape(-1, 1))**2/2.0)
+        y = np.fft.irfft(self._data_fft*kernel_fft, n=self.nbr_grid, axis=1)[:, self._inside]
+        y[y < 1e-10*len(self.data)] = 0
+        return y
+
+    def nbr_modes(self, h):
+        '''
+            Number of modes in I of the KDE for each bandwidth in h.
+        '''
+        h = np.asarray(h, dtype=np.float64)
+        y = self.evaluate_prop(h.reshape(-1))
+        y = np.hstack([np.zeros((len(y), 1)), y, np.zeros((len(y), 1))])
+        is_max = (y[:, 1:-1] > y[:, :-2]) & (y[:, 1:-1] > y[:, 2:])
+        return np.sum(is_max, axis=1).reshape(h.shape)
+
+    def critical_bandwidth(self, m=1):
+        '''
+            Smallest bandwidth for which the KDE has at most m modes in I.
+        '''
+        return self.critical_bandwidths([m])[0]
+
+    def critical_bandwidths(self, ms):
+        '''
+            Critical bandwidths for each number of modes in ms.
+        '''
+        ms = [int(m) for m in ms]
+        new_ms = []
+        lower = []
+        upper = []
+        for m in sorted(set(ms)):
+            if m in self._h_crit:
+                continue
+            above = np.nonzero(self.mode_counts > m)[0]
+            if len(above) == 0:
+                if self._pyramid is None:
+                    self._pyramid = BinningPyramid(self.data)
+                self._h_crit[m] = bisection_search_most_m_modes(
+                    0, self.bandwidths[0], self.htol, self.data, m, self.I,
+                    pyramid=self._pyramid)
+                continue
+            j = above[-1]
+            new_ms.append(m)
+            lower.append(self.bandwidths[j])
+            upper.append(self.bandwidths[j+1] if j+1 < len(self.bandwidths) else self.hmax)
+
+        new_ms = np.array(new_ms, dtype=np.int64)
+        lower = np.array(lower)
+        upper = np.array(upper)
+        while True:
+            active = np.nonzero(upper - lower >= self.htol)[0]
+            if len(active) == 0:
+                break
+            hnew = (lower[active] + upper[active])/2.0
+            at_most_m = self.nbr_modes(hnew) <= new_ms[active]
+            upper[active[at_most_m]] = hnew[at_most_m]
+            lower[active[~at_most_m]] = hnew[~at_most_m]
+        for m, h_crit in zip(new_ms, (lower + upper)/2.0):
+            self._h_crit[m] = h_crit
+
+        return np.array([self._h_crit[m] for m in ms])
+
+
+def critical_bandwidth_exact(data, m=1, I=(-np.inf, np.inf), htol=1e-3, mode_tree=None,
+                             maxiter=20):
+    '''
+        Critical bandwidth for at most m modes in I, to machine precision.
+
+        For the Gaussian kernel the number of modes decreases with h, and
+        a mode disappears where it merges with an antimode, i.e. at a
+        solution (x, h) of f'(x; h) = f''(x; h) = 0, or where an antimode
+        leaves I through an end point x, i.e. f'(x; h) = 0 (a KDE which
+        is increasing towards an end point of I has a mode there, as in
+        kde_has_at_most_m_modes).
+
+        A ModeTree gives the critical bandwidth to within htol, and the
+        modes and antimodes are located on its grid just below it. The
+        pairs of adjacent mode and antimode with the smallest difference
+        in density are the ones that disappear before the critical
+        bandwidth, and for each of them the merge system (or f' = 0 at
+        the end point) is solved with Newton iterations on the exact KDE
+        of data, started from the midpoint of the pair. The critical
+        bandwidth is the largest of the solutions. If the iterations do
+        not converge to a solution consistent with the ModeTree, the
+        ModeTree value is returned.
+
+        Input:
+            data        -   one-dimensional data set.
+            m           -   number of modes.
+            I           -   interval in which modes are counted.
+            htol        -   tolerance for the ModeTree bracket.
+            mode_tree   -   ModeTree of data for the same I, if None it
+                            is constructed.
+            maxiter     -   maximal number of Newton iterations.
+    '''
+    if mode_tree is None:
+        mode_tree = ModeTree(data, I, htol)
+    data = mode_tree.data
+    h_approx = mode_tree.critical_bandwidth(m)
+    if h_approx - mode_tree.htol/2 < mode_tree.bandwidths[0] or h_approx >= mode_tree.hmax:
+        return h_approx
+
+    x = mode_tree.grid[mode_tree._inside]
+    y = mode_tree.evaluate_prop([h_approx - mode_tree.htol/2])[0]
+    y_pad = np.hstack([0, y, 0])
+    maxima = np.nonzero((y_pad[1:-1] > y_pad[:-2]) & (y_pad[1:-1] > y_pad[2:]))[0]
+    nbr_merges = len(maxima) - m
+    if nbr_merges <= 0:
+        return h_approx
+    pairs = []
+    for k in range(len(maxima)-1):
+        antimode = maxima[k] + np.argmin(y[maxima[k]:maxima[k+1]])
+        pairs.append((y[maxima[k]]-y[antimode], maxima[k], antimode))
+        pairs.append((y[maxima[k+1]]-y[antimode], maxima[k+1], antimode))
+    pairs.sort()
+
+    x_ends = (max(I[0], mode_tree.data_min), min(I[1], mode_tree.data_max))
+    h_crit = 0
+    used = set()
+    for _, mode, antimode in pairs:
+        if nbr_merges == 0:
+            break
+        if mode in used or antimode in used:
+            continue
+        used.update([mode, antimode])
+        nbr_merges -= 1
+        if mode == 0 or mode == len(x)-1:
+            x_new = x_ends[0] if mode == 0 else x_ends[-1]
+            h_new = _solve_end_point(data, x_new, h_approx, maxiter)
+        else:
+            x_new, h_new = _solve_merge(data, (x[mode]+x[antimode])/2, h_approx, maxiter)
+        if (h_new is None or abs(h_new-h_approx) > 2*mode_tree.htol or
+                abs(x_new-(x[mode]+x[antimode])/2) > abs(x[mode]-x[antimode]) + 10*mode_tree.dx):
+            return h_approx
+        h_crit = max(h_crit, h_new)
+    return h_crit
+
+
+def _kde_derivatives(data, x, h):
+    '''
+        Derivatives of sum_i exp(-(x-data_i)**2/(2*h**2)):
+        d/dx, d2/dx2, d3/dx3, d2/dxdh, d3/dx2dh.
+    '''
+    u = (x-data)/h
+    u2 = u**2
+    e = np.exp(-u2/2)
+    return (-np.sum(u*e)/h,
+            np.sum((u2-1)*e)/h**2,
+            np.sum((3-u2)*u*e)/h**3,
+            np.sum((2-u2)*u*e)/h**2,
+            np.sum((u2**2-5*u2+2)*e)/h**3)
+
+
+def _solve_merge(data, x, h, maxiter):
+    '''
+        Newton iterations for f'(x; h) = f''(x; h) = 0. Returns (x, h),
+        h is None if the iterations did not converge.
+    '''
+    for _ in range(maxiter):
+        d1, d2, d3, d1h, d2h = _kde_derivatives(data, x, h)
+        det = d2*d2h - d1h*d3
+        if det == 0:
+            return x, None
+        dx = (d2h*d1 - d1h*d2)/det
+        dh = (d2*d2 - d3*d1)/det
+        x -= dx
+        h -= dh
+        if h <= 0:
+            return x, None
+        if abs(dh) <= 4*np.finfo(np.float64).eps*h and abs(dx) <= 4*np.finfo(np.float64).eps*(abs(x)+h):
+            return x, h
+    return x, None
+
+
+def _solve_end_point(data, x, h, maxiter):
+    '''
+        Newton iterations for f'(x; h) = 0 with x fixed. Returns h, None
+        if the iterations did not converge.
+    '''
+    for _ in range(maxiter):
+        d1, _, _, d1h, _ = _kde_derivatives(data, x, h)
+        if d1h == 0:
+            return None
+        dh = d1/d1h
+        h -= dh
+        if h <= 0:
+            return None
+        if abs(dh) <= 4*np.finfo(np.float64).eps*h:
+            return h
+    return None
+
+
 def merge_into(z_new, z):
     if len(z) == 0:
         return z_new
@@ -77,6 +433,7 @@ def merge_into(z_new, z):
     return z_merged
 
 if __name__ == '__main__':
+    import matplotlib.pyplot as plt
     from sklearn.neighbors import KernelDensity
 
     if 0:
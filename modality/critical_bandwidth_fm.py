@@ -1,18 +1,18 @@
 from __future__ import unicode_literals
 from __future__ import print_function
 
-import matplotlib.pyplot as plt
 # from mpi4py import MPI
 import numpy as np
 from scipy.signal import argrelextrema
 from scipy.stats import norm
 from scipy.optimize import minimize, leastsq
-from sklearn.neighbors import KernelDensity
 
-from .util.ApproxGaussianKDE import ApproxGaussianKDE as KDE
 # from .util.bootstrap_MPI import bootstrap, check_equal_mpi
 # from .util import MC_error_check
 from .util.GaussianMixture1d import GaussianMixture1d as GM
+from .util.BinningPyramid import BinningPyramid
+from .util.smoothed_bootstrap import smoothed_bootstrap
+from .critical_bandwidth import get_kde_engine
 
 
 def testfun(x):
@@ -27,10 +27,11 @@ except NameError:
 
 def fisher_marron_critical_bandwidth(data, lamtol, mtol, I=(-np.inf, np.inf), htol=1e-3):
     hmax = (np.max(data)-np.min(data))/2.0
-    return bisection_search_unimodal(0, hmax, htol, data, lamtol, mtol, I)
+    return bisection_search_unimodal(0, hmax, htol, data, lamtol, mtol, I, BinningPyramid(data))
 
 
-def bisection_search_unimodal(hmin, hmax, htol, data, lamtol, mtol, I=(-np.inf, np.inf)):
+def bisection_search_unimodal(hmin, hmax, htol, data, lamtol, mtol, I=(-np.inf, np.inf),
+                              pyramid=None):
     '''
         Assuming fun(xmax) < 0.
     '''
@@ -38,28 +39,37 @@ def bisection_search_unimodal(hmin, hmax, htol, data, lamtol, mtol, I=(-np.inf,
         return (hmin + hmax)/2.0
     hnew = (hmin + hmax)/2.0
     #print "hnew = {}".format(hnew)
-    if is_unimodal_kde(hnew, data, lamtol, mtol, I):  # upper bound for bandwidth
-        return bisection_search_unimodal(hmin, hnew, htol, data, lamtol, mtol, I)
-    return bisection_search_unimodal(hnew, hmax, htol, data, lamtol, mtol, I)
+    if is_unimodal_kde(hnew, data, lamtol, mtol, I, pyramid=pyramid):  # upper bound for bandwidth
+        return bisection_search_unimodal(hmin, hnew, htol, data, lamtol, mtol, I, pyramid)
+    return bisection_search_unimodal(hnew, hmax, htol, data, lamtol, mtol, I, pyramid)
 
 
-def is_resampled_unimodal_kde(kde, resampling_scale_factor, n, h, lamtol, mtol, I=(-np.inf, np.inf)):
-    return is_unimodal_kde(h, kde.sample(n).ravel()*resampling_scale_factor, lamtol, mtol, I)
+def is_resampled_unimodal_kde(data, h_resample, h, lamtol, mtol, I=(-np.inf, np.inf)):
+    # data is resampled by smoothed bootstrap with bandwidth h_resample
+    return is_unimodal_kde(h, smoothed_bootstrap(data, h_resample)[0], lamtol, mtol, I)
 
 
-def is_unimodal_kde(h, data, lamtol, mtol, I=None, debug=False):
-    return len(mode_sizes_kde(h, data, lamtol, mtol, I, debug=debug)) == 0
+def is_unimodal_kde(h, data, lamtol, mtol, I=None, debug=False, pyramid=None):
+    return len(mode_sizes_kde(h, data, lamtol, mtol, I, debug=debug, pyramid=pyramid)) == 0
 
 
 def is_unimodal_from_kde(kde, lamtol, mtol, I, xtol, debug=False):
     return len(mode_sizes_from_kde(kde, lamtol, mtol, I, xtol, debug)) == 0
 
 
-def mode_sizes_kde(h, data, lamtol, mtol, I=None, xtol=None, debug=False):
+def mode_sizes_kde(h, data, lamtol, mtol, I=None, xtol=None, debug=False, kde_engine='binned',
+                   pyramid=None):
+    '''
+        pyramid is a BinningPyramid of data, from which the KDE is
+        formed without binning data again.
+    '''
     if xtol is None:
         xtol = step_size_from_mtol(mtol/2)*h
     #print "xtol = {}".format(xtol)
-    kde = KDE(data, h)
+    if pyramid is None:
+        kde = get_kde_engine(kde_engine)(data, h)
+    else:
+        kde = get_kde_engine(kde_engine).from_pyramid(pyramid, h)
     if I is None:
         I = np.min(data), np.max(data)
     return mode_sizes_from_kde(kde, lamtol, mtol, I, xtol, debug)
@@ -77,13 +87,18 @@ def mode_sizes_from_kde(kde, lamtol, mtol, I, xtol, debug=False):
               kde.evaluate_prop(x)/kde._norm_factor gives the true
               density.
             - distr: A function evaluating the distribution function at
-              the input element.
+              the input vector.
+        The distribution function is tabulated on the current grid,
+        with one call to distr per refinement level (only for levels
+        where mode sizes are needed, and only at points where it is
+        not yet known).
     '''
     lamtol_prop = lamtol*kde._norm_factor  # scaled with same proportionality constant as kde
     #print "lamtol_prop = {}".format(lamtol_prop)
     x_new = np.linspace(I[0], I[1], 40)
     x = np.zeros(0,)
     y = np.zeros(0,)
+    F = np.zeros(0,)  # distribution function on x, nan where not computed
     zero = np.zeros(1,)
     while True:
         if len(x) > 0:
@@ -92,7 +107,9 @@ def mode_sizes_from_kde(kde, lamtol, mtol, I, xtol, debug=False):
         y_new = kde.evaluate_prop(x_new)
         x = merge_into(x_new, x)
         y = merge_into(y_new, y)
+        F = merge_into(np.full(len(x_new), np.nan), F)
         if debug:
+            import matplotlib.pyplot as plt
             fig, axs = plt.subplots(1, 2)
             x_plot = np.linspace(x[0], x[-1], 1000)
             y_plot = kde.evaluate_prop(x_plot)
@@ -136,6 +153,10 @@ def mode_sizes_from_kde(kde, lamtol, mtol, I, xtol, debug=False):
                 if debug:
                     axs[0].plot([x[left_boundaries[i, li]], x[right_boundaries[i, li]]], [lambdas[li]/kde._norm_factor]*2)
 
+            not_computed = np.isnan(F)
+            if not_computed.any():
+                F[not_computed] = kde.distr(x[not_computed])
+
             # Computing size of individual modes.
             big_enough = np.zeros((nbr_modes,), dtype='bool')
             mode_sizes = np.zeros((nbr_modes,))
@@ -143,7 +164,7 @@ def mode_sizes_from_kde(kde, lamtol, mtol, I, xtol, debug=False):
                 li = lambda_ind[i]
                 x_left = x[left_boundaries[i, li]]
                 x_right = x[right_boundaries[i, li]]
-                mode_size = (kde.distr(x_right) - kde.distr(x_left) -
+                mode_size = (F[right_boundaries[i, li]] - F[left_boundaries[i, li]] -
                              lambdas[li]/kde._norm_factor*(x_right-x_left))
                 if debug:
                     print("mode_size {} = {}".format(i, mode_size))
@@ -185,7 +206,7 @@ def mode_sizes_from_kde(kde, lamtol, mtol, I, xtol, debug=False):
                     lambd = lambdas[li]
                     x_left = x[left_boundaries[start, li]]
                     x_right = x[right_boundaries[end-1, li]]
-                    supermode_size = (kde.distr(x_right) - kde.distr(x_left) -
+                    supermode_size = (F[right_boundaries[end-1, li]] - F[left_boundaries[start, li]] -
                                       lambd/kde._norm_factor*(x_right-x_left))
                     if debug:
                         print("supermode_size = {}".format(supermode_size))
@@ -291,6 +312,8 @@ def step_size_from_mtol(mtol):
 
 
 if __name__ == '__main__':
+    import matplotlib.pyplot as plt
+    from sklearn.neighbors import KernelDensity
 
     if 0:
         import time
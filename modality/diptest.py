@@ -2,28 +2,26 @@ from __future__ import unicode_literals
 from __future__ import division
 from __future__ import print_function
 
-from collections import Counter
+import csv
+import multiprocessing
 import os
-import pkg_resources
 
-import matplotlib.pyplot as plt
 import numpy as np
-import pandas
 
+from .util.jit import jit, numba_available
+from .util import SortedBlocks
 
-qDiptab_file = pkg_resources.resource_filename('modality', 'data/qDiptab.csv')
 
-if not os.path.exists(qDiptab_file):
-    qDiptab_df = None
-else:
-    qDiptab_df = pandas.read_csv(qDiptab_file, index_col=0)
+qDiptab_file = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            'data', 'qDiptab.csv')
+qDiptab_npy_file = os.path.splitext(qDiptab_file)[0]+'.npy'
 
 
 class DataError(Exception):
     pass
 
 
-def hartigan_diptest(data):
+def hartigan_diptest(data, engine=None):
     '''
     P-value according to Hartigan's dip test for unimodality.
     The dip is computed using the function
@@ -36,45 +34,419 @@ def hartigan_diptest(data):
 
     Input:
         data    -   one-dimensional data set.
+        engine  -   algorithm used to compute the dip, 'hull' or
+                    'linear' (see dip_engines), None for the default.
 
     Value:
         p-value for the test.
     '''
-    return pval_hartigan(data)
+    return pval_hartigan(data, engine)
 
 
-def pval_hartigan(data):
+def pval_hartigan(data, engine=None):
     xF, yF = cum_distr(data)
-    dip = dip_from_cdf(xF, yF)
+    dip = dip_from_cdf(xF, yF, engine=engine)
     return dip_pval_tabinterpol(dip, len(data))
 
 
-def dip_resampled_from_unimod(unimod, N):
+def hartigan_diptest_columns(X, axis=0, n_jobs=1, engine=None):
+    '''
+    Hartigan's dip test (see hartigan_diptest) for each column of X
+    (each row if axis=1). With n_jobs > 1 the columns are split over a
+    pool of processes, which read X from shared memory instead of
+    receiving it pickled.
+
+    Input:
+        X       -   two-dimensional array, each column (row if axis=1)
+                    is a data set.
+        axis    -   axis along which the data sets lie.
+        n_jobs  -   number of processes, None for one per CPU.
+        engine  -   algorithm used to compute the dips, 'hull' or
+                    'linear' (see dip_engines), None for the default.
+
+    Value:
+        dips, pvals    -   dips and p-values for the data sets.
+    '''
+    X = np.asarray(X, dtype=np.float64)
+    if X.ndim != 2:
+        raise ValueError('X must be two-dimensional')
+    if axis == 0:
+        X = X.T
+    dips = dip_rows_parallel(X, n_jobs, engine)
+    return dips, dip_pval_tabinterpol(dips, X.shape[1])
+
+
+def dip_rows_parallel(X, n_jobs=1, engine=None):
+    '''
+    Dips of the rows of X, computed with dip_batch by a pool of n_jobs
+    processes (None for one per CPU) sharing X.
+    '''
+    if n_jobs is None:
+        n_jobs = multiprocessing.cpu_count()
+    n_jobs = min(n_jobs, X.shape[0])
+    if n_jobs <= 1:
+        return dip_batch(X, engine)
+    shared = multiprocessing.RawArray('d', X.size)
+    np.frombuffer(shared, dtype=np.float64).reshape(X.shape)[...] = X
+    bounds = np.linspace(0, X.shape[0], 4*n_jobs+1).astype(int)
+    tasks = [(start, stop, engine) for start, stop in zip(bounds[:-1], bounds[1:])
+             if stop > start]
+    pool = multiprocessing.Pool(n_jobs, initializer=_init_rows_worker,
+                                initargs=(shared, X.shape))
+    try:
+        dips = np.hstack(pool.map(_dip_rows_worker, tasks))
+        pool.close()
+    finally:
+        pool.terminate()
+    return dips
+
+
+_rows_worker_data = None
+
+
+def _init_rows_worker(shared, shape):
+    global _rows_worker_data
+    _rows_worker_data = np.frombuffer(shared, dtype=np.float64).reshape(shape)
+
+
+def _dip_rows_worker(task):
+    start, stop, engine = task
+    return dip_batch(_rows_worker_data[start:stop], engine)
+
+
+def hartigan_diptest_counts(values, counts, engine=None):
+    '''
+    Same as hartigan_diptest, for data given as a histogram, e.g. a
+    discretised channel, where values[i] occurs counts[i] times. The
+    cost depends on the number of values, not on the number of
+    observations sum(counts).
+
+    Input:
+        values  -   one-dimensional array of values.
+        counts  -   number of observations of each value.
+        engine  -   algorithm used to compute the dip, 'hull' or
+                    'linear' (see dip_engines), None for the default.
+
+    Value:
+        p-value for the test.
+    '''
+    return pval_hartigan_counts(values, counts, engine)
+
+
+def pval_hartigan_counts(values, counts, engine=None):
+    xF, yF = cum_distr_from_counts(values, counts)
+    dip = dip_from_cdf(xF, yF, engine=engine)
+    return dip_pval_tabinterpol(dip, np.sum(counts))
+
+
+def hartigan_diptest_sketch(sketch, engine=None):
+    '''
+    Hartigan's dip test for data summarised by a QuantileSketch, e.g.
+    data arriving in chunks or distributed over workers.
+
+    Input:
+        sketch  -   modality.util.QuantileSketch of the data.
+        engine  -   algorithm used to compute the dip, 'hull' or
+                    'linear' (see dip_engines), None for the default.
+
+    Value:
+        p-value for the test computed from the sketch, and lower and
+        upper bounds for the p-value of the full data.
+    '''
+    dip, dip_error = dip_from_sketch(sketch, engine)
+    pvals = dip_pval_tabinterpol(
+        np.array([dip, dip+dip_error, max(dip-dip_error, 0)]), sketch.n)
+    return pvals[0], pvals[1], pvals[2]
+
+
+def dip_from_sketch(sketch, engine=None):
+    '''
+    Dip of data summarised by a QuantileSketch. The distribution
+    function of the sketch is within sketch.cdf_error of the empirical
+    distribution function of the data, and the dip is 1-Lipschitz in
+    the supremum norm, so the dip of the data is within the returned
+    error of the returned dip.
+
+    Value:
+        dip, error
+    '''
+    xF, yF = cum_distr(*sketch.items_and_weights())
+    return dip_from_cdf(xF, yF, engine=engine), sketch.cdf_error
+
+
+def hartigan_diptest_subsets(sorted_data, subsets, engine=None):
+    '''
+    Hartigan's dip test for many subsets of one data set, e.g. the
+    events of one channel in every node of a gating tree. The data is
+    sorted once, and the sorted subsets are extracted from the global
+    order.
+
+    Input:
+        sorted_data -   modality.util.SortedData of the data set.
+        subsets     -   boolean masks (a two-dimensional array with one
+                        mask per row, or a list) or arrays of indices.
+        engine      -   algorithm used to compute the dips, 'hull' or
+                        'linear' (see dip_engines), None for the default.
+
+    Value:
+        dips, pvals    -   dips and p-values for the subsets.
+    '''
+    dips, Ns = dip_subsets(sorted_data, subsets, engine)
+    return dips, dip_pval_tabinterpol(dips, Ns)
+
+
+def dip_subsets(sorted_data, subsets, engine=None):
+    '''
+    Dips of subsets of a SortedData (see hartigan_diptest_subsets),
+    computed in one DipWorkspace with engine 'linear'.
+
+    Value:
+        dips, Ns    -   dips and sizes of the subsets.
+    '''
+    if isinstance(subsets, np.ndarray) and subsets.ndim == 2 and subsets.dtype == np.bool_:
+        masks = sorted_data.sorted_masks(subsets)
+        subsets = (sorted_data.data_sort[mask] for mask in masks)
+    else:
+        subsets = (sorted_data.subset(subset) for subset in subsets)
+    engine = default_dip_engine(engine)
+    workspace = DipWorkspace(len(sorted_data)) if engine == 'linear' else None
+    dips = []
+    Ns = []
+    for data_sort in subsets:
+        if len(data_sort) == 0:
+            raise ValueError('Dip of empty subset')
+        if workspace is not None:
+            dips.append(dip_sorted_workspace(data_sort, workspace))
+        else:
+            dips.append(dip_from_cdf(*cum_distr(data_sort, is_sorted=True), engine=engine))
+        Ns.append(len(data_sort))
+    return np.array(dips), np.array(Ns)
+
+
+class WindowedDipMonitor(object):
+    '''
+    Hartigan's dip test over a sliding window of the last W events of
+    a time-ordered stream, e.g. to detect when a channel turns bimodal
+    during an acquisition.
+
+    The window is kept in a modality.util.SortedBlocks, so that an
+    update with r events costs O(r log W) plus the rewriting of the
+    blocks (of a few thousand events) that the events enter or leave.
+    The dip is recomputed (with dip_sorted_workspace, in a DipWorkspace
+    allocated once) only when needed. The dip is 1-Lipschitz in the
+    supremum norm of the EDF, so the dip of the current window is
+    within dip_error = max_x |A(x)-R(x)|/W of the last computed dip,
+    where A(x) and R(x) are the numbers of events <= x that have
+    entered and left the window since that computation. Events
+    entering and leaving in the same region cancel, so dip_error grows
+    like sqrt(r)/W rather than r/W for a stationary stream. The
+    p-values at both ends of this interval are interpolated in one
+    vectorised call, and the dip is recomputed when they are on
+    different sides of alpha, when the error exceeds max_dip_error,
+    while the window is not yet full and when no dip has been
+    computed yet. Without numba the dip is computed with engine 'hull'
+    instead.
+
+    Input:
+        W               -   number of events in the window.
+        alpha           -   significance level.
+        max_dip_error   -   if not None, the dip is also recomputed
+                            when its error bound exceeds this value.
+    '''
+
+    def __init__(self, W, alpha=0.05, max_dip_error=None):
+        self.W = W
+        self.alpha = alpha
+        self.max_dip_error = max_dip_error
+        self.buffer = np.empty(W)  # events in order of arrival (ring buffer)
+        self.start = 0
+        self.n = 0
+        self.window = SortedBlocks()
+        self.workspace = DipWorkspace(W) if numba_available() else None
+        self.dip = np.nan
+        self.dip_error = np.inf
+        self.nbr_computations = 0
+        # events that entered (+1) or left (-1) the window since the
+        # last computation, sorted by value
+        self._changes = np.zeros(0)
+        self._change_signs = np.zeros(0)
+
+    @property
+    def window_sort(self):
+        return self.window.to_array()
+
+    def update(self, events):
+        '''
+        Add events (in order of arrival) to the window, removing the
+        oldest events if the window is full.
+
+        Value:
+            p-value for the test computed from the last computed dip,
+            and lower and upper bounds for the p-value of the current
+            window.
+        '''
+        events = np.asarray(events, dtype=np.float64).ravel()[-self.W:]
+        nbr_removed = max(self.n + len(events) - self.W, 0)
+        removed = self.buffer[(self.start + np.arange(nbr_removed)) % self.W]
+        self.buffer[(self.start + self.n + np.arange(len(events))) % self.W] = events
+        self.start = (self.start + nbr_removed) % self.W
+        self.n += len(events) - nbr_removed
+        self.window.remove(removed)
+        self.window.insert(events)
+
+        self._add_changes(events, removed)
+        self.dip_error = self._edf_change()/self.W
+        if self.n < self.W or np.isnan(self.dip) or (
+                self.max_dip_error is not None and self.dip_error > self.max_dip_error):
+            return self.recompute()
+        pvals = dip_pval_tabinterpol(
+            np.array([self.dip, self.dip+self.dip_error,
+                      max(self.dip-self.dip_error, 0)]), self.n)
+        if (pvals[1] < self.alpha) != (pvals[2] < self.alpha):
+            return self.recompute()
+        return pvals[0], pvals[1], pvals[2]
+
+    def recompute(self):
+        '''
+        Compute the dip of the current window.
+
+        Value:
+            p-value, and the same value as lower and upper bound.
+        '''
+        window_sort = self.window_sort
+        if self.workspace is None:
+            self.dip = dip_from_cdf(*cum_distr(window_sort, is_sorted=True))
+        else:
+            self.dip = dip_sorted_workspace(window_sort, self.workspace)
+        self.dip_error = 0.
+        self._changes = np.zeros(0)
+        self._change_signs = np.zeros(0)
+        self.nbr_computations += 1
+        pval = dip_pval_tabinterpol(self.dip, self.n)
+        return pval, pval, pval
+
+    def _add_changes(self, entered, left):
+        values = np.hstack([entered, left])
+        order = np.argsort(values)
+        signs = np.hstack([np.ones(len(entered)), -np.ones(len(left))])[order]
+        values = values[order]
+        ind = np.searchsorted(self._changes, values)
+        self._changes = np.insert(self._changes, ind, values)
+        self._change_signs = np.insert(self._change_signs, ind, signs)
+
+    def _edf_change(self):
+        '''
+        max_x |A(x)-R(x)|, see class docstring.
+        '''
+        net = np.cumsum(self._change_signs)
+        # the net count is only attained after the last copy of a value
+        last = np.hstack([self._changes[1:] != self._changes[:-1], True])
+        return np.max(np.abs(net[last]), initial=0)
+
+
+def dip_resampled_from_unimod(unimod, N, engine=None):
     data = sample_from_unimod(unimod, N)
-    xF, yF = cum_distr(data)
-    return dip_from_cdf(xF, yF)
+    xF, yF = cum_distr(data, is_sorted=True)
+    return dip_from_cdf(xF, yF, engine=engine)
+
+
+def dip_resampled_from_unimod_batch(unimod, N, B, engine=None, max_points=10**6):
+    '''
+    Dips of B samples of size N from unimod, sampled in batches of at
+    most max_points points (but at least one sample).
+    '''
+    batch = max(1, max_points//N)
+    dips = np.empty(B)
+    for i in range(0, B, batch):
+        n = min(batch, B-i)
+        data = sample_from_unimod_batch(unimod, N, n)
+        dips[i:(i+n)] = dip_batch(data, engine, is_sorted=True)
+    return dips
+
+
+def dip_batch(samples, engine=None, is_sorted=False):
+    '''
+    Dips of the rows of samples (B x N), i.e. of B data sets of size N.
+    Unless is_sorted, all rows are sorted in one call. With engine
+    'linear' the EDFs and dips are computed in one DipWorkspace shared
+    by all rows.
+    '''
+    if not is_sorted:
+        samples = np.sort(samples, axis=1)
+    dips = np.empty(samples.shape[0])
+    if default_dip_engine(engine) == 'linear':
+        workspace = DipWorkspace(samples.shape[1])
+        for i, data in enumerate(samples):
+            dips[i] = dip_sorted_workspace(data, workspace)
+        return dips
+    for i, data in enumerate(samples):
+        xF, yF = cum_distr(data, is_sorted=True)
+        dips[i] = dip_from_cdf(xF, yF, engine=engine)
+    return dips
 
 
 def sample_from_unimod(unimod, N):
+    '''
+    Sorted sample of size N from the distribution with piecewise
+    linear distribution function unimod = (xU, yU).
+    '''
+    return sample_from_unimod_batch(unimod, N, 1)[0]
+
+
+def sample_from_unimod_batch(unimod, N, B):
+    '''
+    B sorted samples (rows) of size N from the distribution with
+    piecewise linear distribution function unimod = (xU, yU).
+
+    The number of points in each linear piece is drawn with one
+    multinomial draw per sample. Within a piece with k points, the
+    points are uniform order statistics, obtained as cumulative sums
+    of k+1 exponential spacings divided by their total. Pieces are
+    sorted, so the sample is generated sorted and never needs to be
+    sorted.
+    '''
     xU, yU = unimod
-    #print "zip(xU, yU) = {}".format(zip(xU, yU))
     dxU = np.diff(xU)
-    t = np.random.rand(N)
-    bins = np.searchsorted(yU, t)-1
-    bin_cnt = Counter(bins).most_common()
-    data = np.zeros((N,))
-    i = 0
-    for bin, cnt in bin_cnt:
-        data[i:i+cnt] = np.random.rand(cnt)*dxU[bin]+xU[bin]
-        i += cnt
-    return data
-
-
-def dip_from_cdf(xF, yF, plotting=False, verbose=False, eps=1e-12):
-    dip, _ = dip_and_closest_unimodal_from_cdf(xF, yF, plotting, verbose, eps)
+    p = np.maximum(np.diff(yU), 0)
+    counts = np.random.multinomial(N, p/np.sum(p), size=B).ravel()
+    nbr_bins = len(p)
+
+    # Each piece gets one block of counts+1 spacings; row b of the
+    # spacings holds the blocks of sample b.
+    spacings_cum = np.cumsum(np.random.exponential(size=(B, N+nbr_bins)), axis=1).ravel()
+    block_end = np.cumsum(counts+1)
+    block_start = block_end - (counts+1)
+    block_base = np.where(block_start % (N+nbr_bins) == 0, 0,
+                          spacings_cum[block_start-1])
+    block_total = spacings_cum[block_end-1] - block_base
+    is_point = np.ones(len(spacings_cum), dtype='bool')
+    is_point[block_end-1] = False
+
+    block = np.repeat(np.arange(len(counts)), counts)
+    u = (spacings_cum[is_point] - block_base[block])/block_total[block]
+    bins = block % nbr_bins
+    return (xU[bins] + u*dxU[bins]).reshape(B, N)
+
+
+def dip_from_cdf(xF, yF, plotting=False, verbose=False, eps=1e-12, engine=None):
+    if plotting and engine is None:
+        engine = 'hull'
+    dip, _ = get_dip_engine(engine)(xF, yF, plotting, verbose, eps)
     return dip
 
 
+def get_dip_engine(engine):
+    '''
+    Function computing dip and closest unimodal distribution function
+    from EDF, see dip_engines. engine None gives the default engine,
+    see default_dip_engine.
+    '''
+    try:
+        return dip_engines[default_dip_engine(engine)]
+    except KeyError:
+        raise ValueError('Unknown dip engine: {}'.format(engine))
+
+
 def dip_and_closest_unimodal_from_cdf(xF, yF, plotting=False, verbose=False, eps=1e-12):
     '''
     Dip computed as distance between empirical distribution function (EDF) and
@@ -102,6 +474,7 @@ def dip_and_closest_unimodal_from_cdf(xF, yF, plotting=False, verbose=False, eps
         raise ValueError('Need sorted y-values to compute dip')
 
     if plotting:
+        import matplotlib.pyplot as plt
         Nplot = 5
         bfig = plt.figure(figsize=(12, 3))
         i = 1  # plot index
@@ -117,15 +490,15 @@ def dip_and_closest_unimodal_from_cdf(xF, yF, plotting=False, verbose=False, eps
     # convex minorant to (xF, yF+dip)
     # iHfin are the indices of xF where the optimal unimodal distribution is least
     # concave majorant to (xF, yF-dip)
-    iGfin = L
-    iHfin = U
+    iGfin = [np.array([L])]
+    iHfin = [np.array([U])]  # in reverse order
 
     while 1:
 
         iGG = greatest_convex_minorant_sorted(xF[L:(U+1)], yF[L:(U+1)])
         iHH = least_concave_majorant_sorted(xF[L:(U+1)], yF[L:(U+1)])
-        iG = np.arange(L, U+1)[iGG]
-        iH = np.arange(L, U+1)[iHH]
+        iG = iGG + L
+        iH = iHH + L
 
         # Interpolate. First and last point are in both and does not need
         # interpolation. Might cause trouble if included due to possiblity
@@ -172,8 +545,8 @@ def dip_and_closest_unimodal_from_cdf(xF, yF, plotting=False, verbose=False, eps
             U0 = iH[imaxdiffh]
             L0 = iG[iG <= U0][-1]
         # Add points outside the modal interval to the final GCM and LCM.
-        iGfin = np.hstack([iGfin, iG[(iG <= L0)*(iG > L)]])
-        iHfin = np.hstack([iH[(iH >= U0)*(iH < U)], iHfin])
+        iGfin.append(iG[(iG <= L0)*(iG > L)])
+        iHfin.append(iH[(iH >= U0)*(iH < U)])
 
         # Plot new modal interval
         if plotting:
@@ -210,6 +583,10 @@ def dip_and_closest_unimodal_from_cdf(xF, yF, plotting=False, verbose=False, eps
                 print("Difference in modal interval smaller than new dip")
             break
 
+    iGfin = np.hstack(iGfin)
+    iHfin = np.hstack(iHfin[::-1])
+    xU, yU = closest_unimodal_from_modal_interval(xF, yF, D, iGfin, iHfin)
+
     if plotting:
 
         # Add modal interval to figure
@@ -222,34 +599,7 @@ def dip_and_closest_unimodal_from_cdf(xF, yF, plotting=False, verbose=False, eps
         bax.plot(xF, yF, color='red')
         bax.plot(xF, yF-D/2, color='black')
         bax.plot(xF, yF+D/2, color='black')
-
-    # Find string position in modal interval
-    iM = np.arange(iGfin[-1], iHfin[0]+1)
-    yM_lower = yF[iM]-D/2
-    yM_lower[0] = yF[iM[0]]+D/2
-    iMM_concave = least_concave_majorant_sorted(xF[iM], yM_lower)
-    iM_concave = iM[iMM_concave]
-    #bax.plot(xF[iM], yM_lower, color='orange')
-    #bax.plot(xF[iM_concave], yM_lower[iMM_concave], color='red')
-    lcm_ipl = np.interp(xF[iM], xF[iM_concave], yM_lower[iMM_concave])
-    try:
-        mode = iM[np.nonzero(lcm_ipl > yF[iM]+D/2)[0][-1]]
-        #bax.axvline(xF[mode], color='green', linestyle='dashed')
-    except IndexError:
-        iM_convex = np.zeros(0, dtype='i')
-    else:
-        after_mode = iM_concave > mode
-        iM_concave = iM_concave[after_mode]
-        iMM_concave = iMM_concave[after_mode]
-        iM = iM[iM <= mode]
-        iM_convex = iM[greatest_convex_minorant_sorted(xF[iM], yF[iM])]
-
-    if plotting:
-
-        bax.plot(xF[np.hstack([iGfin, iM_convex, iM_concave, iHfin])],
-                 np.hstack([yF[iGfin] + D/2, yF[iM_convex] + D/2,
-                            yM_lower[iMM_concave], yF[iHfin] - D/2]), color='blue')
-        #bax.plot(xF[iM], yM_lower, color='orange')
+        bax.plot(xU[1:-1], yU[1:-1], color='blue')
 
         ## Plot unimodal distribution function
         bfig = plt.figure()
@@ -257,19 +607,155 @@ def dip_and_closest_unimodal_from_cdf(xF, yF, plotting=False, verbose=False, eps
         bax.plot(xF, yF, color='red')
         bax.plot(xF, yF-D/2, color='black')
         bax.plot(xF, yF+D/2, color='black')
+        bax.plot(xU, yU, color='blue')
+        plt.show()
+
+    return D/2, (xU, yU)
+
+
+def dip_and_closest_unimodal_from_cdf_linear(xF, yF, plotting=False, verbose=False, eps=1e-12):
+    '''
+    Same as dip_and_closest_unimodal_from_cdf, but in linear time, in
+    the spirit of algorithm AS 217 in
+
+        Hartigan (1985): Computation of the dip statistic to test for
+        unimodaliy. Applied Statistics, vol. 34, no. 3
+
+    The greatest convex minorant (GCM) of every prefix and the least
+    concave majorant (LCM) of every suffix of (xF, yF) are computed
+    once, stored as pointers to the previous and next hull vertex
+    respectively. The lower end of the modal interval is always a
+    vertex of the GCM of the prefix ending at the upper end, and vice
+    versa, so the GCM and LCM in each pass are found by following the
+    pointers instead of being recomputed from scratch. Each pass then
+    costs time proportional to the number of hull vertices plus the
+    number of points that leave the modal interval.
+
+    Plotting is not available, use dip_and_closest_unimodal_from_cdf.
+
+    xF  -   x-coordinates for EDF
+    yF  -   y-coordinates for EDF
+
+    '''
+    if plotting:
+        raise ValueError("Plotting is only available with dip engine 'hull'")
+
+    if (xF[1:]-xF[:-1] < -eps).any():
+        raise ValueError('Need sorted x-values to compute dip')
+    if (yF[1:]-yF[:-1] < -eps).any():
+        raise ValueError('Need sorted y-values to compute dip')
+
+    iGfin = [np.array([0])]
+    iHfin = [np.array([len(xF)-1])]  # in reverse order
+    D = twice_dip_linear(xF, yF, verbose=verbose, eps=eps, iGfin=iGfin, iHfin=iHfin)
+    iGfin = np.hstack(iGfin)
+    iHfin = np.hstack(iHfin[::-1])
+    return D/2, closest_unimodal_from_modal_interval(xF, yF, D, iGfin, iHfin)
+
+
+def twice_dip_linear(xF, yF, gcm_prev=None, lcm_next=None, verbose=False, eps=1e-12,
+                     iGfin=None, iHfin=None):
+    '''
+    Twice the dip of the EDF (xF, yF), computed as in
+    dip_and_closest_unimodal_from_cdf_linear. xF and yF are assumed
+    to be sorted.
+
+    gcm_prev, lcm_next  -   work arrays of integers (at least as long as
+                            xF) for the hull pointers, allocated if
+                            None.
+    iGfin, iHfin        -   if lists, the final GCM and LCM outside
+                            the modal interval are appended to them
+                            (iHfin in reverse order).
+    '''
+    _require_numba()
+    n = len(xF)
+    if gcm_prev is None:
+        gcm_prev = np.empty(n, dtype=np.int64)
+    if lcm_next is None:
+        lcm_next = np.empty(n, dtype=np.int64)
+    _gcm_prefix_pointers(xF, yF, gcm_prev)
+    _lcm_suffix_pointers(xF, yF, lcm_next)
+
+    D = 0  # lower bound for dip*2
+
+    # [L, U] is the modal interval, see dip_and_closest_unimodal_from_cdf.
+    L = 0
+    U = n - 1
+
+    while 1:
+
+        iG = _follow_pointers(gcm_prev, U, L)[::-1]
+        iH = _follow_pointers(lcm_next, L, U)
+
+        hipl = np.interp(xF[iG[1:-1]], xF[iH], yF[iH])
+        gipl = np.interp(xF[iH[1:-1]], xF[iG], yF[iG])
+        hipl = np.hstack([yF[iH[0]], hipl, yF[iH[-1]]])
+        gipl = np.hstack([yF[iG[0]], gipl, yF[iG[-1]]])
+
+        # Find largest difference between GCM and LCM.
+        gdiff = hipl - yF[iG]
+        hdiff = yF[iH] - gipl
+        imaxdiffg = np.argmax(gdiff)
+        imaxdiffh = np.argmax(hdiff)
+        d = max(gdiff[imaxdiffg], hdiff[imaxdiffh])
+
+        if d <= D:
+            if verbose:
+                print("Difference in modal interval smaller than current dip")
+            break
+
+        # Find new modal interval so that largest difference is at endpoint.
+        if gdiff[imaxdiffg] > hdiff[imaxdiffh]:
+            L0 = iG[imaxdiffg]
+            U0 = iH[np.searchsorted(iH, L0)]
+        else:
+            U0 = iH[imaxdiffh]
+            L0 = iG[np.searchsorted(iG, U0, side='right')-1]
+        # Add points outside the modal interval to the final GCM and LCM.
+        if iGfin is not None:
+            iGfin.append(iG[1:np.searchsorted(iG, L0, side='right')])
+        if iHfin is not None:
+            iHfin.append(iH[np.searchsorted(iH, U0):-1])
+
+        # Compute new lower bound for dip*2
+        # i.e. largest difference outside modal interval
+        gipl = np.interp(xF[L:(L0+1)], xF[iG], yF[iG])
+        D = max(D, np.amax(yF[L:(L0+1)] - gipl))
+        hipl = np.interp(xF[U0:(U+1)], xF[iH], yF[iH])
+        D = max(D, np.amax(hipl - yF[U0:(U+1)]))
+
+        if xF[U0]-xF[L0] < eps:
+            if verbose:
+                print("Modal interval zero length")
+            break
+
+        # Change modal interval
+        L = L0
+        U = U0
+
+        if d <= D:
+            if verbose:
+                print("Difference in modal interval smaller than new dip")
+            break
+
+    return D
+
 
+def closest_unimodal_from_modal_interval(xF, yF, D, iGfin, iHfin):
+    '''
+    Closest unimodal distribution function (xU, yU) given the dip
+    D/2 and the indices of the final GCM (iGfin) and LCM (iHfin)
+    outside the modal interval [iGfin[-1], iHfin[0]].
+    '''
     # Find string position in modal interval
     iM = np.arange(iGfin[-1], iHfin[0]+1)
     yM_lower = yF[iM]-D/2
     yM_lower[0] = yF[iM[0]]+D/2
     iMM_concave = least_concave_majorant_sorted(xF[iM], yM_lower)
     iM_concave = iM[iMM_concave]
-    #bax.plot(xF[iM], yM_lower, color='orange')
-    #bax.plot(xF[iM_concave], yM_lower[iMM_concave], color='red')
     lcm_ipl = np.interp(xF[iM], xF[iM_concave], yM_lower[iMM_concave])
     try:
         mode = iM[np.nonzero(lcm_ipl > yF[iM]+D/2)[0][-1]]
-        #bax.axvline(xF[mode], color='green', linestyle='dashed')
     except IndexError:
         iM_convex = np.zeros(0, dtype='i')
     else:
@@ -290,53 +776,257 @@ def dip_and_closest_unimodal_from_cdf(xF, yF, plotting=False, verbose=False, eps
     xU_end = xU[-1] + (1-yU[-1])/k_end
     xU = np.hstack([xU_start, xU, xU_end])
     yU = np.hstack([0, yU, 1])
+    return xU, yU
 
-    if plotting:
-        bax.plot(xU, yU, color='blue')
-        #bax.plot(xF[iM], yM_lower, color='orange')
-        plt.show()
 
-    return D/2, (xU, yU)
+class DipWorkspace(object):
+    '''
+    Preallocated work arrays for twice_dip_workspace and
+    dip_sorted_workspace, for data sets of up to n observations (EDFs
+    of up to 2n points). The arrays are only reallocated if a larger
+    data set is passed, so a caller computing many dips, e.g. a
+    bootstrap worker, allocates nothing per dip after the first.
+    Requires numba, see _require_numba.
+    '''
+
+    def __init__(self, n=0):
+        _require_numba()
+        self.n = -1
+        self.reserve(n)
+
+    def reserve(self, n):
+        if n <= self.n:
+            return
+        m = max(2*n, 2)
+        self.xF = np.empty(m)
+        self.yF = np.empty(m)
+        self.gcm_prev = np.empty(m, dtype=np.int64)
+        self.lcm_next = np.empty(m, dtype=np.int64)
+        self.iG = np.empty(m, dtype=np.int64)
+        self.iH = np.empty(m, dtype=np.int64)
+        self.iGfin = np.empty(m, dtype=np.int64)
+        self.iHfin = np.empty(m, dtype=np.int64)
+        self.nbr_iGfin = 0
+        self.start_iHfin = m
+        self.n = n
+
+    def final_hulls(self):
+        '''
+        Indices of the final GCM and LCM outside the modal interval
+        from the last call to twice_dip_workspace (as used by
+        closest_unimodal_from_modal_interval).
+        '''
+        return self.iGfin[:self.nbr_iGfin], self.iHfin[self.start_iHfin:]
+
+
+def twice_dip_workspace(xF, yF, workspace, eps=1e-12):
+    '''
+    Twice the dip of the EDF (xF, yF), computed as in twice_dip_linear
+    but without plotting or bookkeeping: every step runs once, in the
+    arrays of workspace (a DipWorkspace), so that nothing is allocated
+    when the kernels are compiled with numba. xF and yF are assumed to
+    be sorted. The final GCM and LCM are available from
+    workspace.final_hulls().
+    '''
+    workspace.reserve((len(xF)+1)//2)
+    _gcm_prefix_pointers(xF, yF, workspace.gcm_prev)
+    _lcm_suffix_pointers(xF, yF, workspace.lcm_next)
+    D, workspace.nbr_iGfin, workspace.start_iHfin = _twice_dip_kernel(
+        xF, yF, workspace.gcm_prev, workspace.lcm_next, workspace.iG, workspace.iH,
+        workspace.iGfin, workspace.iHfin, eps)
+    if D < 0:
+        raise ValueError('Hull does not pass through end of modal interval')
+    return D
+
+
+def dip_sorted_workspace(data_sort, workspace, eps=1e-10):
+    '''
+    Dip of sorted data, with the EDF (see cum_distr) built in
+    workspace as well.
+    '''
+    workspace.reserve(len(data_sort))
+    m = _cum_distr_sorted_kernel(data_sort, eps, workspace.xF, workspace.yF)
+    return twice_dip_workspace(workspace.xF[:m], workspace.yF[:m], workspace)/2
+
+
+# 'linear' requires numba
+dip_engines = {'hull': dip_and_closest_unimodal_from_cdf,
+               'linear': dip_and_closest_unimodal_from_cdf_linear}
+
+
+def default_dip_engine(engine=None):
+    '''
+    engine, or if None the default dip engine: 'linear' if numba is
+    installed, so that repeated dips (e.g. in bootstrap workers) are
+    computed in a DipWorkspace, and 'hull' otherwise.
+    '''
+    if engine is None:
+        return 'linear' if numba_available() else 'hull'
+    return engine
+
+
+def _require_numba():
+    '''
+    The linear engine runs its passes in jitted kernels, which without
+    numba are Python loops over all points and much slower than the
+    vectorized engine 'hull'.
+    '''
+    if not numba_available():
+        raise ImportError("Dip engine 'linear' requires numba "
+                          "(pip install .[jit]), use engine 'hull' without it")
 
 
 def dip_pval_tabinterpol(dip, N):
     '''
-    dip     -   dip value computed from dip_from_cdf
-    N       -   number of observations
+    dip     -   dip value computed from dip_from_cdf, or array of dips
+    N       -   number of observations, or array of numbers of
+                observations
+    '''
+    return get_dip_pval_interpolator()(dip, N)
+
+
+_dip_pval_interpolator = None
+
+
+def get_dip_pval_interpolator():
+    '''
+    DipPvalInterpolator for the tabulated p-values, built at first use.
+    The table is memory-mapped from qDiptab_npy_file if it exists,
+    otherwise it is parsed from qDiptab_file.
+    '''
+    global _dip_pval_interpolator
+    if _dip_pval_interpolator is None:
+        if os.path.exists(qDiptab_npy_file):
+            table = load_dip_table(qDiptab_npy_file)
+        elif os.path.exists(qDiptab_file):
+            table = read_dip_table_csv(qDiptab_file)
+        else:
+            raise DataError("Tabulated p-values not available, {} missing. "
+                            "See installation instructions.".format(qDiptab_file))
+        _dip_pval_interpolator = DipPvalInterpolator(*table)
+    return _dip_pval_interpolator
+
+
+def read_dip_table_csv(csv_file):
+    '''
+    Reads a table of dip quantiles written by write_qdiptab.R, i.e.
+    with the numbers of observations as first column and the
+    probabilities as header.
+
+    Value:
+        (Ns, ps, diptable), see DipPvalInterpolator.
+    '''
+    with open(csv_file) as f:
+        rows = [row for row in csv.reader(f) if len(row) > 0]
+    ps = np.array(rows[0][1:], dtype=np.float64)
+    Ns = np.array([row[0] for row in rows[1:]], dtype=np.float64)
+    diptable = np.array([row[1:] for row in rows[1:]], dtype=np.float64)
+    return Ns, ps, diptable
+
+
+def save_dip_table(npy_file, Ns, ps, diptable):
+    '''
+    Saves a table of dip quantiles packed into one .npy array: the
+    first row holds the probabilities, the first column the numbers
+    of observations and the rest the quantiles (same layout as the
+    csv file). Load it with load_dip_table.
     '''
-    if qDiptab_df is None:
-        raise DataError("Tabulated p-values not available, {} missing. "
-                        "See installation instructions.".format(qDiptab_file))
+    packed = np.empty((len(Ns)+1, len(ps)+1))
+    packed[0, 0] = np.nan
+    packed[0, 1:] = ps
+    packed[1:, 0] = Ns
+    packed[1:, 1:] = diptable
+    np.save(npy_file, packed)
 
-    if np.isnan(N) or N < 10:
-        return np.nan
 
-    diptable = np.array(qDiptab_df)
-    ps = np.array(qDiptab_df.columns).astype(float)
-    Ns = np.array(qDiptab_df.index)
+def load_dip_table(npy_file, mmap_mode='r'):
+    '''
+    Loads a table of dip quantiles saved with save_dip_table. With
+    the default mmap_mode the file is memory-mapped rather than read,
+    so processes loading the same table share its pages.
 
-    if N >= Ns[-1]:
-        dip = transform_dip_to_other_nbr_pts(dip, N, Ns[-1]-0.1)
-        N = Ns[-1]-0.1
+    Value:
+        (Ns, ps, diptable), see DipPvalInterpolator.
+    '''
+    packed = np.load(npy_file, mmap_mode=mmap_mode)
+    return packed[1:, 0], packed[0, 1:], packed[1:, 1:]
 
-    iNlow = np.nonzero(Ns < N)[0][-1]
-    qN = (N-Ns[iNlow])/(Ns[iNlow+1]-Ns[iNlow])
-    dip_sqrtN = np.sqrt(N)*dip
-    dip_interpol_sqrtN = (
-        np.sqrt(Ns[iNlow])*diptable[iNlow, :] + qN*(
-            np.sqrt(Ns[iNlow+1])*diptable[iNlow+1, :]-np.sqrt(Ns[iNlow])*diptable[iNlow, :]))
 
-    if not (dip_interpol_sqrtN < dip_sqrtN).any():
-        return 1
+def convert_dip_table(csv_file=qDiptab_file, npy_file=qDiptab_npy_file):
+    '''
+    Converts a csv table of dip quantiles (see read_dip_table_csv) to
+    the binary format of save_dip_table.
+    '''
+    save_dip_table(npy_file, *read_dip_table_csv(csv_file))
 
-    iplow = np.nonzero(dip_interpol_sqrtN < dip_sqrtN)[0][-1]
-    if iplow == len(dip_interpol_sqrtN) - 1:
-        return 0
 
-    qp = (dip_sqrtN-dip_interpol_sqrtN[iplow])/(dip_interpol_sqrtN[iplow+1]-dip_interpol_sqrtN[iplow])
-    p_interpol = ps[iplow] + qp*(ps[iplow+1]-ps[iplow])
+class DipPvalInterpolator(object):
+    '''
+    P-values for Hartigan's dip test, interpolated from a table of
+    quantiles of the dip under the null hypothesis. Quantiles are
+    interpolated linearly in sqrt(N)*dip between the tabulated numbers
+    of observations, and the p-value linearly between the tabulated
+    probabilities. For N beyond the table, the dip is first rescaled
+    with transform_dip_to_other_nbr_pts.
 
-    return 1 - p_interpol
+    Input:
+        Ns          -   tabulated numbers of observations (increasing).
+        ps          -   tabulated probabilities (increasing).
+        diptable    -   diptable[i, j] is the ps[j]-quantile of the dip
+                        for Ns[i] observations.
+    '''
+
+    def __init__(self, Ns, ps, diptable):
+        self.Ns = np.ascontiguousarray(Ns, dtype=np.float64)
+        self.ps = np.ascontiguousarray(ps, dtype=np.float64)
+        self.sqrtN_diptable = np.ascontiguousarray(
+            np.sqrt(self.Ns)[:, np.newaxis]*diptable, dtype=np.float64)
+
+    def __call__(self, dip, N):
+        '''
+        P-values for dips with N observations. dip and N are scalars
+        or arrays (broadcast against each other).
+        '''
+        dip, N = np.broadcast_arrays(np.asarray(dip, dtype=np.float64),
+                                     np.asarray(N, dtype=np.float64))
+        shape = dip.shape
+        dip = dip.ravel()
+        N = N.ravel()
+        pval = np.full(len(dip), np.nan)
+        valid = N >= 10  # False for nan
+        dip = dip[valid]
+        N = N[valid]
+
+        N_max = self.Ns[-1]-0.1
+        beyond = N >= self.Ns[-1]
+        dip[beyond] = transform_dip_to_other_nbr_pts(dip[beyond], N[beyond], N_max)
+        N[beyond] = N_max
+
+        iNlow = np.searchsorted(self.Ns, N)-1
+        qN = (N-self.Ns[iNlow])/(self.Ns[iNlow+1]-self.Ns[iNlow])
+        dip_sqrtN = np.sqrt(N)*dip
+        dip_interpol_sqrtN = self.sqrtN_diptable[iNlow, :] + qN[:, np.newaxis]*(
+            self.sqrtN_diptable[iNlow+1, :]-self.sqrtN_diptable[iNlow, :])
+
+        below = dip_interpol_sqrtN < dip_sqrtN[:, np.newaxis]
+        nbr_p = len(self.ps)
+        iplow = nbr_p - 1 - np.argmax(below[:, ::-1], axis=1)
+        iplow_next = np.minimum(iplow+1, nbr_p-1)
+        rows = np.arange(len(dip))
+        dip_low = dip_interpol_sqrtN[rows, iplow]
+        dip_high = dip_interpol_sqrtN[rows, iplow_next]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            qp = (dip_sqrtN-dip_low)/(dip_high-dip_low)
+            p_interpol = self.ps[iplow] + qp*(self.ps[iplow_next]-self.ps[iplow])
+
+        pval_valid = 1 - p_interpol
+        pval_valid[iplow == nbr_p-1] = 0
+        pval_valid[~below.any(axis=1)] = 1
+        pval[valid] = pval_valid
+        pval = pval.reshape(shape)
+        if pval.ndim == 0:
+            return pval[()]
+        return pval
 
 
 def transform_dip_to_other_nbr_pts(dip_n, n, m):
@@ -344,34 +1034,72 @@ def transform_dip_to_other_nbr_pts(dip_n, n, m):
     return dip_m
 
 
-def cum_distr(data, w=None):
-    if w is None:
-        w = np.ones(len(data))*1./len(data)
-    eps = 1e-10
-    data_ord = np.argsort(data)
-    data_sort = data[data_ord]
-    w_sort = w[data_ord]
-    data_sort, indices = unique(data_sort, return_index=True, eps=eps, is_sorted=True)
-    if len(indices) < len(data_ord):
-        w_unique = np.zeros(len(indices))
-        for i in range(len(indices)-1):
-            w_unique[i] = np.sum(w_sort[indices[i]:indices[i+1]])
-        w_unique[-1] = np.sum(w_sort[indices[-1]:])
-        w_sort = w_unique
-    wcum = np.cumsum(w_sort)
-    wcum /= wcum[-1]
+def cum_distr(data, w=None, is_sorted=False, eps=1e-10):
+    '''
+    Empirical distribution function (EDF) of data as a curve (x, y)
+    with a vertical step at each unique data value, i.e. each unique
+    value occurs twice in x. Data values closer than eps to the
+    previous value are counted as copies of it.
 
-    N = len(data_sort)
-    x = np.empty(2*N)
-    x[2*np.arange(N)] = data_sort
-    x[2*np.arange(N)+1] = data_sort
+    Input:
+        data        -   one-dimensional data set.
+        w           -   data weights, if None all data points have the
+                        same weight.
+        is_sorted   -   is data (and w) already sorted? Then sorting
+                        is skipped.
+    '''
+    data = np.asarray(data)
+    if is_sorted:
+        data_sort = data
+        w_sort = w
+    else:
+        data_ord = np.argsort(data)
+        data_sort = data[data_ord]
+        w_sort = None if w is None else np.asarray(w)[data_ord]
+    indices = unique_sorted_index(data_sort, eps)
+    if w_sort is None:
+        wcum = np.append(indices[1:], len(data_sort))*1./len(data_sort)
+    else:
+        wcum = np.cumsum(np.add.reduceat(w_sort, indices))
+        wcum /= wcum[-1]
+
+    N = len(indices)
+    x = np.repeat(data_sort[indices], 2)
     y = np.empty(2*N)
     y[0] = 0
-    y[2*np.arange(N)+1] = wcum
-    y[2*np.arange(N-1)+2] = wcum[:-1]
+    y[1::2] = wcum
+    y[2::2] = wcum[:-1]
     return x, y
 
 
+def cum_distr_from_counts(values, counts, is_sorted=False, eps=1e-10):
+    '''
+    Empirical distribution function (see cum_distr) of data where
+    values[i] occurs counts[i] times. Computed in O(K log K), or O(K)
+    if is_sorted, for K values, independently of the number of
+    observations.
+    '''
+    values = np.asarray(values)
+    counts = np.asarray(counts)
+    if (counts < 0).any():
+        raise ValueError('Counts must be non-negative')
+    nonzero = counts > 0
+    return cum_distr(values[nonzero], counts[nonzero].astype(np.float64),
+                     is_sorted, eps)
+
+
+def unique_sorted_index(data_sort, eps):
+    '''
+    Indices of the first copy of each unique value in sorted data,
+    where values closer than eps to the previous value are counted as
+    copies.
+    '''
+    is_first = np.empty(len(data_sort), dtype='bool')
+    is_first[:1] = True
+    np.greater_equal(np.diff(data_sort), eps, out=is_first[1:])
+    return np.flatnonzero(is_first)
+
+
 # def lin_interpol(xquery, x, y):
 #     xq_ord = np.argsort(xquery)
 #     xord = np.argsort(x)
@@ -409,30 +1137,16 @@ def cum_distr(data, w=None):
 def unique(data, return_index, eps, is_sorted=True):
     if not is_sorted:
         ord = np.argsort(data)
-        rank = np.argsort(ord)
         data_sort = data[ord]
     else:
         data_sort = data
-    isunique_sort = np.ones(len(data_sort), dtype='bool')
-    j = 0
-    for i in range(1, len(data_sort)):
-        if data_sort[i] - data_sort[j] < eps:
-            isunique_sort[i] = False
-        else:
-            j = i
+    ind_unique = unique_sorted_index(data_sort, eps)
     if not is_sorted:
-        isunique = isunique_sort[rank]
-        data_unique = data[isunique]
-    else:
-        data_unique = data[isunique_sort]
+        ind_unique = np.sort(ord[ind_unique])
+    data_unique = data[ind_unique]
 
     if not return_index:
         return data_unique
-
-    if not is_sorted:
-        ind_unique = np.nonzero(isunique)[0]
-    else:
-        ind_unique = np.nonzero(isunique_sort)[0]
     return data_unique, ind_unique
 
 
@@ -441,9 +1155,8 @@ def greatest_convex_minorant(x, y):
     return i, xnew, -negy
 
 
-def greatest_convex_minorant_sorted(x, y):
-    i = least_concave_majorant_sorted(x, -y)
-    return i
+def greatest_convex_minorant_sorted(x, y, eps=1e-12):
+    return _hull_sorted(x, y, eps, upper=False)
 
 
 def least_concave_majorant(x, y, eps=1e-12):
@@ -457,6 +1170,36 @@ def least_concave_majorant(x, y, eps=1e-12):
 
 
 def least_concave_majorant_sorted(x, y, eps=1e-12):
+    return _hull_sorted(x, y, eps, upper=True)
+
+
+def _hull_sorted(x, y, eps, upper):
+    '''
+    Indices of the vertices of the least concave majorant (upper=True)
+    or greatest convex minorant (upper=False) of (x, y), computed with
+    Andrew's monotone chain in one pass. Collinear points are kept as
+    vertices. x must be sorted with at most two copies of each value;
+    at such a vertical step only the copies on the hull are kept.
+    Without numba the hull is found by the vectorized search in
+    _hull_sorted_numpy instead, since the monotone chain is then a
+    Python loop over all points.
+    '''
+    if not numba_available():
+        return _hull_sorted_numpy(x, y if upper else -y, eps)
+    ind, nbr = _monotone_chain(x, y, eps, upper)
+    if nbr < 0:
+        raise ValueError('Maximum two copies of each x-value allowed')
+    return ind[:nbr]
+
+
+def _hull_sorted_numpy(x, y, eps):
+    '''
+    Indices of the vertices of the least concave majorant of (x, y),
+    found by taking the steepest chord from each vertex to the rest
+    of the curve. Loops in Python over the hull vertices only.
+    '''
+    if np.any(np.abs(x[2:]-x[:-2]) <= eps):
+        raise ValueError('Maximum two copies of each x-value allowed')
     i = [0]
     icurr = 0
     while icurr < len(x) - 1:
@@ -472,11 +1215,255 @@ def least_concave_majorant_sorted(x, y, eps=1e-12):
             icurr += 2 + np.argmax(q)
             i.append(icurr)
         else:
-            print("x[icurr] = {}, x[icurr+1] = {}, x[icurr+2] = {}".format(x[icurr], x[icurr+1], x[icurr+2]))
             raise ValueError('Maximum two copies of each x-value allowed')
-
     return np.array(i)
 
+
+@jit
+def _monotone_chain(x, y, eps, upper):
+    sign = 1. if upper else -1.
+    ind = np.empty(len(x), dtype=np.int64)  # used as stack
+    nbr = 0
+    for j in range(len(x)):
+        if j > 1 and abs(x[j]-x[j-2]) <= eps:
+            return ind, -1
+        while nbr > 1:
+            i = ind[nbr-2]
+            k = ind[nbr-1]
+            if sign*((x[k]-x[i])*(y[j]-y[i]) - (y[k]-y[i])*(x[j]-x[i])) > 0:
+                nbr -= 1  # k strictly inside the hull
+            else:
+                break
+        ind[nbr] = j
+        nbr += 1
+    return ind, nbr
+
+
+@jit
+def _gcm_prefix_pointers(x, y, gcm_prev):
+    '''
+    gcm_prev[j] is set to the vertex before j on the greatest convex
+    minorant of (x[:j+1], y[:j+1]). Collinear points are not vertices.
+    '''
+    gcm_prev[0] = 0
+    for j in range(1, len(x)):
+        k = j-1
+        while k > 0:
+            i = gcm_prev[k]
+            if (y[k]-y[i])*(x[j]-x[i]) >= (y[j]-y[i])*(x[k]-x[i]):
+                k = i  # k is not below line from i to j
+            else:
+                break
+        gcm_prev[j] = k
+    return gcm_prev
+
+
+@jit
+def _lcm_suffix_pointers(x, y, lcm_next):
+    '''
+    lcm_next[j] is set to the vertex after j on the least concave
+    majorant of (x[j:], y[j:]). Collinear points are not vertices.
+    '''
+    n = len(x)
+    lcm_next[n-1] = n-1
+    for j in range(n-2, -1, -1):
+        k = j+1
+        while k < n-1:
+            i = lcm_next[k]
+            if (y[k]-y[j])*(x[i]-x[j]) <= (y[i]-y[j])*(x[k]-x[j]):
+                k = i  # k is not above line from j to i
+            else:
+                break
+        lcm_next[j] = k
+    return lcm_next
+
+
+@jit
+def _cum_distr_sorted_kernel(data_sort, eps, xF, yF):
+    '''
+    Fills xF and yF with the EDF of sorted data (as cum_distr) and
+    returns its number of points.
+    '''
+    N = len(data_sort)
+    m = 0
+    for i in range(N):
+        if i == 0 or data_sort[i]-data_sort[i-1] >= eps:
+            if m > 0:
+                yF[2*m-1] = i/N
+                yF[2*m] = i/N
+            xF[2*m] = data_sort[i]
+            xF[2*m+1] = data_sort[i]
+            m += 1
+    yF[0] = 0.
+    yF[2*m-1] = 1.
+    return 2*m
+
+
+@jit
+def _twice_dip_kernel(xF, yF, gcm_prev, lcm_next, iG, iH, iGfin, iHfin, eps):
+    '''
+    Loop version of the passes in twice_dip_linear, with the same
+    floating point operations as np.interp (interpolation at x on
+    segment jj, the last hull segment starting at or before x).
+    iGfin is filled from the start and iHfin from the end.
+
+    Value:
+        (D, number of points in iGfin, start of iHfin), D = -1 if the
+        hulls do not pass through the ends of the modal interval.
+    '''
+    n = len(xF)
+    D = 0.
+    L = 0
+    U = n - 1
+    iGfin[0] = 0
+    nbr_iGfin = 1
+    start_iHfin = len(iHfin) - 1
+    iHfin[start_iHfin] = n - 1
+
+    while True:
+
+        # GCM and LCM of modal interval from the hull pointers
+        nG = 1
+        i = U
+        while i > L:
+            i = gcm_prev[i]
+            nG += 1
+        if i != L:
+            return -1., nbr_iGfin, start_iHfin
+        i = U
+        for k in range(nG-1, -1, -1):
+            iG[k] = i
+            i = gcm_prev[i]
+        nH = 1
+        i = L
+        iH[0] = L
+        while i < U:
+            i = lcm_next[i]
+            iH[nH] = i
+            nH += 1
+        if i != U:
+            return -1., nbr_iGfin, start_iHfin
+
+        # Largest difference between GCM and LCM
+        gmax = 0.
+        jgmax = 0
+        jj = 0
+        for j in range(1, nG-1):
+            x = xF[iG[j]]
+            while jj < nH-2 and xF[iH[jj+1]] <= x:
+                jj += 1
+            if x >= xF[iH[nH-1]]:
+                hipl = yF[iH[nH-1]]
+            else:
+                hipl = ((yF[iH[jj+1]]-yF[iH[jj]])/(xF[iH[jj+1]]-xF[iH[jj]])
+                        * (x-xF[iH[jj]]) + yF[iH[jj]])
+            if hipl - yF[iG[j]] > gmax:
+                gmax = hipl - yF[iG[j]]
+                jgmax = j
+        hmax = 0.
+        jhmax = 0
+        jj = 0
+        for j in range(1, nH-1):
+            x = xF[iH[j]]
+            while jj < nG-2 and xF[iG[jj+1]] <= x:
+                jj += 1
+            if x >= xF[iG[nG-1]]:
+                gipl = yF[iG[nG-1]]
+            else:
+                gipl = ((yF[iG[jj+1]]-yF[iG[jj]])/(xF[iG[jj+1]]-xF[iG[jj]])
+                        * (x-xF[iG[jj]]) + yF[iG[jj]])
+            if yF[iH[j]] - gipl > hmax:
+                hmax = yF[iH[j]] - gipl
+                jhmax = j
+        d = max(gmax, hmax)
+
+        if d <= D:
+            break
+
+        # New modal interval
+        if gmax > hmax:
+            jL0 = jgmax
+            L0 = iG[jL0]
+            jU0 = 0
+            while iH[jU0] < L0:
+                jU0 += 1
+            U0 = iH[jU0]
+        else:
+            jU0 = jhmax
+            U0 = iH[jU0]
+            jL0 = nG - 1
+            while iG[jL0] > U0:
+                jL0 -= 1
+            L0 = iG[jL0]
+        for j in range(1, jL0+1):
+            iGfin[nbr_iGfin] = iG[j]
+            nbr_iGfin += 1
+        for j in range(nH-2, jU0-1, -1):
+            start_iHfin -= 1
+            iHfin[start_iHfin] = iH[j]
+
+        # Largest difference outside modal interval
+        jj = 0
+        for k in range(L, L0+1):
+            x = xF[k]
+            while jj < nG-2 and xF[iG[jj+1]] <= x:
+                jj += 1
+            if x >= xF[iG[nG-1]]:
+                gipl = yF[iG[nG-1]]
+            else:
+                gipl = ((yF[iG[jj+1]]-yF[iG[jj]])/(xF[iG[jj+1]]-xF[iG[jj]])
+                        * (x-xF[iG[jj]]) + yF[iG[jj]])
+            D = max(D, yF[k] - gipl)
+        jj = 0
+        for k in range(U0, U+1):
+            x = xF[k]
+            while jj < nH-2 and xF[iH[jj+1]] <= x:
+                jj += 1
+            if x >= xF[iH[nH-1]]:
+                hipl = yF[iH[nH-1]]
+            else:
+                hipl = ((yF[iH[jj+1]]-yF[iH[jj]])/(xF[iH[jj+1]]-xF[iH[jj]])
+                        * (x-xF[iH[jj]]) + yF[iH[jj]])
+            D = max(D, hipl - yF[k])
+
+        if xF[U0]-xF[L0] < eps:
+            break
+
+        L = L0
+        U = U0
+
+        if d <= D:
+            break
+
+    return D, nbr_iGfin, start_iHfin
+
+
+def _follow_pointers(pointers, start, stop):
+    ind, nbr = _follow_pointers_jit(pointers, start, stop)
+    if ind[nbr-1] != stop:
+        raise ValueError('Hull does not pass through index {}'.format(stop))
+    return ind[:nbr]
+
+
+@jit
+def _follow_pointers_jit(pointers, start, stop):
+    ind = np.empty(abs(stop-start)+1, dtype=np.int64)
+    i = start
+    ind[0] = i
+    nbr = 1
+    if start > stop:
+        while i > stop:
+            i = pointers[i]
+            ind[nbr] = i
+            nbr += 1
+    else:
+        while i < stop:
+            i = pointers[i]
+            ind[nbr] = i
+            nbr += 1
+    return ind, nbr
+
+
 if __name__ == '__main__':
     #seed = np.random.randint(1000)
     for seed in [None, 403, 796]:
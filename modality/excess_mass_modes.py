@@ -1,7 +1,6 @@
 from __future__ import unicode_literals
 from __future__ import print_function
 
-import matplotlib.pyplot as plt
 import numpy as np
 
 from .diptest import dip_and_closest_unimodal_from_cdf, cum_distr
@@ -120,6 +119,7 @@ def Delta_Nn_best_lambda_in_unimodal(data, w, n, plotting=False):
     #print "dip = {}".format(dip)
     D_max = -np.inf
     if plotting:
+        import matplotlib.pyplot as plt
         fig, axs = plt.subplots(int(np.ceil((len(x_uni)-1)*1./5)), 5)
     else:
         axs = [None]*len(x_uni)-1
@@ -1,20 +1,20 @@
 from __future__ import unicode_literals
-from mpi4py import MPI
 import numpy as np
-from sklearn.neighbors import KernelDensity
 
-from .util.bootstrap_MPI import bootstrap, probability_above, \
+from .util.bootstrap_MPI import bootstrap, bootstrap_batch, probability_above, \
     MaxSampExceededException
-from .util import get_I
+from .util import get_I, smoothed_bootstrap
+from .util.mpi_comm import comm_world
 from .calibration.lambda_alphas_access import load_lambda
 from . import diptest
-from .critical_bandwidth import critical_bandwidth, is_unimodal_kde
+from .critical_bandwidth import critical_bandwidth, is_unimodal_kde_batch
 from .critical_bandwidth_fm import fisher_marron_critical_bandwidth, \
     is_resampled_unimodal_kde
 
 
 def calibrated_diptest(data, alpha, null, adaptive_resampling=True, N_adaptive_max=10000,
-                       N_non_adaptive=1000, comm=MPI.COMM_WORLD, calibration_file=None):
+                       N_non_adaptive=1000, comm=None, calibration_file=None,
+                       engine=None):
     '''
         Perform diptest calibrated at level alpha.
 
@@ -38,10 +38,15 @@ def calibrated_diptest(data, alpha, null, adaptive_resampling=True, N_adaptive_m
                                     mined.
             N_non_adaptive      -   number of bootstrap samples if not
                                     adaptive resampling.
-            comm                -   communicator for MPI
+            comm                -   communicator for MPI, MPI.COMM_WORLD
+                                    if None.
             calibration_file    -   file with calibration constants. If
                                     None, precomputed constants are
                                     used.
+            engine              -   algorithm used to compute the dips,
+                                    'hull' or 'linear' (see
+                                    diptest.dip_engines), None for
+                                    diptest.default_dip_engine().
 
         Value:
             If adaptive_resampling=True:
@@ -55,14 +60,39 @@ def calibrated_diptest(data, alpha, null, adaptive_resampling=True, N_adaptive_m
     '''
     if adaptive_resampling:
         return test_calibrated_dip_adaptive_resampling(
-            data, alpha, null, N_adaptive_max, comm, calibration_file)
+            data, alpha, null, N_adaptive_max, comm, calibration_file, engine)
     return pval_calibrated_dip(
-        data, alpha, null, N_non_adaptive, comm, calibration_file)
+        data, alpha, null, N_non_adaptive, comm, calibration_file, engine)
+
+
+def calibrated_diptest_counts(values, counts, alpha, null, adaptive_resampling=True,
+                              N_adaptive_max=10000, N_non_adaptive=1000, comm=None,
+                              calibration_file=None, engine=None):
+    '''
+        Same as calibrated_diptest, for data given as a histogram,
+        e.g. a discretised channel, where values[i] occurs counts[i]
+        times. The dip of the data is computed from the K values
+        only, without expanding them to sum(counts) observations.
+
+        Input:
+            values              -   one-dimensional array of values.
+            counts              -   number of observations of each
+                                    value.
+            Other input as for calibrated_diptest.
+
+        Value:
+            As for calibrated_diptest.
+    '''
+    if adaptive_resampling:
+        return test_calibrated_dip_adaptive_resampling(
+            values, alpha, null, N_adaptive_max, comm, calibration_file, engine, counts)
+    return pval_calibrated_dip(
+        values, alpha, null, N_non_adaptive, comm, calibration_file, engine, counts)
 
 
 def calibrated_bwtest(data, alpha, null, I='auto', adaptive_resampling=True,
-                      N_adaptive_max=10000, N_non_adaptive=1000, comm=MPI.COMM_WORLD,
-                      calibration_file=None):
+                      N_adaptive_max=10000, N_non_adaptive=1000, comm=None,
+                      calibration_file=None, mode_tree=None):
     '''
         Perform bandwidth test calibrated at level alpha.
 
@@ -91,9 +121,15 @@ def calibrated_bwtest(data, alpha, null, I='auto', adaptive_resampling=True,
                                     mined.
             N_non_adaptive      -   number of bootstrap samples if not
                                     adaptive resampling.
+            comm                -   communicator for MPI, MPI.COMM_WORLD
+                                    if None.
             calibration_file    -   file with calibration constants. If
                                     None, precomputed constants are
                                     used.
+            mode_tree           -   ModeTree of data for the same I,
+                                    from which the critical bandwidth is
+                                    taken. If None, it is computed by
+                                    bisection.
 
         Value:
             If adaptive_resampling=True:
@@ -107,13 +143,14 @@ def calibrated_bwtest(data, alpha, null, I='auto', adaptive_resampling=True,
     '''
     if adaptive_resampling:
         return test_calibrated_bandwidth_adaptive_resampling(
-            data, alpha, null, I, N_adaptive_max, comm, calibration_file)
+            data, alpha, null, I, N_adaptive_max, comm, calibration_file,
+            mode_tree)
     return pval_calibrated_bandwidth(
-        data, alpha, null, I, N_non_adaptive, comm, calibration_file)
+        data, alpha, null, I, N_non_adaptive, comm, calibration_file, mode_tree)
 
 
 def silverman_bwtest(data, alpha, I='auto', adaptive_resampling=True, N_adaptive_max=10000,
-                     N_non_adaptive=1000, comm=MPI.COMM_WORLD):
+                     N_non_adaptive=1000, comm=None, mode_tree=None):
     '''
         Perform Silverman's bandwidth test.
 
@@ -141,6 +178,12 @@ def silverman_bwtest(data, alpha, I='auto', adaptive_resampling=True, N_adaptive
                                     mined.
             N_non_adaptive      -   number of bootstrap samples if not
                                     adaptive resampling.
+            comm                -   communicator for MPI, MPI.COMM_WORLD
+                                    if None.
+            mode_tree           -   ModeTree of data for the same I,
+                                    from which the critical bandwidth is
+                                    taken. If None, it is computed by
+                                    bisection.
 
         Value:
             If adaptive_resampling=True:
@@ -153,33 +196,39 @@ def silverman_bwtest(data, alpha, I='auto', adaptive_resampling=True, N_adaptive
     '''
 
     if adaptive_resampling:
-        return test_silverman_adaptive_resampling(data, alpha, I, N_adaptive_max, comm)
-    return pval_silverman(data, I, N_non_adaptive, comm)
+        return test_silverman_adaptive_resampling(data, alpha, I, N_adaptive_max, comm,
+                                                  mode_tree)
+    return pval_silverman(data, I, N_non_adaptive, comm, mode_tree)
 
 
 def test_calibrated_dip_adaptive_resampling(data, alpha, null, N_bootstrap_max=10000,
-                                            comm=MPI.COMM_WORLD, calibration_file=None):
+                                            comm=None, calibration_file=None,
+                                            engine=None, counts=None):
+    comm = comm_world(comm)
     data = comm.bcast(data)
+    counts = comm.bcast(counts)
     try:
         lambda_alpha = load_lambda('dip_ad', null, alpha, calibration_file)
            # loading lambda computed with adaptive probablistic bisection search
     except KeyError:
         lambda_alpha = load_lambda('dip_ex', null, alpha, calibration_file)
            # loading lambda computed with probabilistic bisection search
-    xF, yF = diptest.cum_distr(data)
-    dip, unimod = diptest.dip_and_closest_unimodal_from_cdf(xF, yF)
-    resamp_fun = lambda: diptest.dip_resampled_from_unimod(unimod, len(data)) > lambda_alpha*dip
+    xF, yF, N = _cum_distr(data, counts)
+    dip, unimod = diptest.get_dip_engine(engine)(xF, yF)
+    resamp_fun = lambda B: diptest.dip_resampled_from_unimod_batch(
+        unimod, N, B, engine) > lambda_alpha*dip
     try:
         return float(probability_above(resamp_fun, alpha, max_samp=N_bootstrap_max, comm=comm,
                      batch=100, bound_significance=0.05, exception_at_max_samp=True,
-                     printing=False))
+                     printing=False, vectorized=True))
     except MaxSampExceededException:
         return alpha
 
 
 def test_calibrated_bandwidth_adaptive_resampling(data, alpha, null, I='auto',
-                                                  N_bootstrap_max=10000, comm=MPI.COMM_WORLD,
-                                                  calibration_file=None):
+                                                  N_bootstrap_max=10000, comm=None,
+                                                  calibration_file=None, mode_tree=None):
+    comm = comm_world(comm)
     data = comm.bcast(data)
     I = get_I(data, I)
     try:
@@ -188,96 +237,109 @@ def test_calibrated_bandwidth_adaptive_resampling(data, alpha, null, I='auto',
     except KeyError:
         lambda_alpha = load_lambda('bw', null, alpha, calibration_file)
            # loading lambda computed with probabilistic bisection search
-    h_crit = critical_bandwidth(data, I)
-    var_data = np.var(data)
-    KDE_h_crit = KernelDensity(kernel='gaussian', bandwidth=h_crit).fit(data.reshape(-1, 1))
-    resamp_fun = lambda: not is_unimodal_kde(
-        h_crit*lambda_alpha, KDE_h_crit.sample(len(data)).ravel()/np.sqrt(1+h_crit**2/var_data), I)
+    h_crit = _critical_bandwidth(data, I, mode_tree)
+    resamp_fun = lambda B: ~is_unimodal_kde_batch(
+        h_crit*lambda_alpha, smoothed_bootstrap(data, h_crit, B), I)
     try:
         return float(probability_above(resamp_fun, alpha, max_samp=N_bootstrap_max, comm=comm,
                      batch=100, bound_significance=0.05, exception_at_max_samp=True,
-                     printing=False))
+                     printing=False, vectorized=True))
     except MaxSampExceededException:
         return alpha
 
 
 def test_silverman_adaptive_resampling(data, alpha, I='auto',
-                                       N_bootstrap_max=10000, comm=MPI.COMM_WORLD):
+                                       N_bootstrap_max=10000, comm=None, mode_tree=None):
+    comm = comm_world(comm)
     data = comm.bcast(data)
     I = get_I(data, I)
-    h_crit = critical_bandwidth(data, I)
-    var_data = np.var(data)
-    KDE_h_crit = KernelDensity(kernel='gaussian', bandwidth=h_crit).fit(data.reshape(-1, 1))
-    resamp_fun = lambda: not is_unimodal_kde(
-        h_crit, KDE_h_crit.sample(len(data)).ravel()/np.sqrt(1+h_crit**2/var_data), I)
+    h_crit = _critical_bandwidth(data, I, mode_tree)
+    resamp_fun = lambda B: ~is_unimodal_kde_batch(
+        h_crit, smoothed_bootstrap(data, h_crit, B), I)
     try:
         return float(probability_above(resamp_fun, alpha, max_samp=N_bootstrap_max, comm=comm,
                      batch=100, bound_significance=0.05, exception_at_max_samp=True,
-                     printing=False))
+                     printing=False, vectorized=True))
     except MaxSampExceededException:
         return alpha
 
 
-def pval_calibrated_dip(data, alpha_cal, null, N_bootstrap=1000, comm=MPI.COMM_WORLD,
-                        calibration_file=None):
+def pval_calibrated_dip(data, alpha_cal, null, N_bootstrap=1000, comm=None,
+                        calibration_file=None, engine=None, counts=None):
     '''
         NB!: Test is only calibrated to correct level for alpha_cal.
     '''
+    comm = comm_world(comm)
     data = comm.bcast(data)
+    counts = comm.bcast(counts)
     try:
         lambda_alpha = load_lambda('dip_ad', null, alpha_cal, calibration_file)
     except KeyError:
         lambda_alpha = load_lambda('dip_ex', null, alpha_cal, calibration_file)
-    xF, yF = diptest.cum_distr(data)
-    dip, unimod = diptest.dip_and_closest_unimodal_from_cdf(xF, yF)
-    resamp_fun = lambda: diptest.dip_resampled_from_unimod(unimod, len(data))
-    resamp_dips = bootstrap(resamp_fun, N_bootstrap, dtype=np.float_, comm=comm)
+    xF, yF, N = _cum_distr(data, counts)
+    dip, unimod = diptest.get_dip_engine(engine)(xF, yF)
+    resamp_fun = lambda B: diptest.dip_resampled_from_unimod_batch(unimod, N, B, engine)
+    resamp_dips = bootstrap_batch(resamp_fun, N_bootstrap, dtype=np.float_, comm=comm)
     return np.mean(resamp_dips > lambda_alpha*dip)
 
 
-def pval_silverman(data, I='auto', N_bootstrap=1000, comm=MPI.COMM_WORLD):
+def pval_silverman(data, I='auto', N_bootstrap=1000, comm=None, mode_tree=None):
     I = get_I(data, I)
+    comm = comm_world(comm)
     data = comm.bcast(data)
-    h_crit = critical_bandwidth(data, I)
-    var_data = np.var(data)
-    KDE_h_crit = KernelDensity(kernel='gaussian', bandwidth=h_crit).fit(data.reshape(-1, 1))
-    resamp_fun = lambda: is_unimodal_kde(
-        h_crit, KDE_h_crit.sample(len(data)).ravel()/np.sqrt(1+h_crit**2/var_data), I)
-    smaller_equal_crit_bandwidth = bootstrap(resamp_fun, N_bootstrap, dtype=np.bool_,
-                                             comm=comm)
+    h_crit = _critical_bandwidth(data, I, mode_tree)
+    resamp_fun = lambda B: is_unimodal_kde_batch(
+        h_crit, smoothed_bootstrap(data, h_crit, B), I)
+    smaller_equal_crit_bandwidth = bootstrap_batch(resamp_fun, N_bootstrap, dtype=np.bool_,
+                                                   comm=comm)
     return np.mean(~smaller_equal_crit_bandwidth)
 
 
 def pval_calibrated_bandwidth(data, alpha_cal, null, I='auto',
-                              N_bootstrap=1000, comm=MPI.COMM_WORLD,
-                              calibration_file=None):
+                              N_bootstrap=1000, comm=None,
+                              calibration_file=None, mode_tree=None):
     '''
         NB!: Test is only calibrated to correct level for alpha_cal.
     '''
+    comm = comm_world(comm)
     data = comm.bcast(data)
     I = get_I(data, I)
     try:
         lambda_alpha = load_lambda('bw_ad', null, alpha_cal, calibration_file)
     except KeyError:
         lambda_alpha = load_lambda('bw', null, alpha_cal, calibration_file)
-    h_crit = critical_bandwidth(data, I)
-    var_data = np.var(data)
-    KDE_h_crit = KernelDensity(kernel='gaussian', bandwidth=h_crit).fit(data.reshape(-1, 1))
-    resamp_fun = lambda: is_unimodal_kde(
-        h_crit*lambda_alpha, KDE_h_crit.sample(len(data)).ravel()/np.sqrt(1+h_crit**2/var_data), I)
-    smaller_equal_crit_bandwidth = bootstrap(resamp_fun, N_bootstrap, dtype=np.bool_, comm=comm)
+    h_crit = _critical_bandwidth(data, I, mode_tree)
+    resamp_fun = lambda B: is_unimodal_kde_batch(
+        h_crit*lambda_alpha, smoothed_bootstrap(data, h_crit, B), I)
+    smaller_equal_crit_bandwidth = bootstrap_batch(resamp_fun, N_bootstrap, dtype=np.bool_,
+                                                   comm=comm)
     return np.mean(~smaller_equal_crit_bandwidth)
 
 
 def pval_bandwidth_fm(data, lamtol, mtol, I='auto', N_bootstrap=1000,
-                      comm=MPI.COMM_WORLD):
+                      comm=None):
+    comm = comm_world(comm)
     data = comm.bcast(data)
     I = get_I(data, I)
     lambda_alpha = 1  # TODO: Replace with correct value according to Cheng & Hall methodology
     h_crit = fisher_marron_critical_bandwidth(data, lamtol, mtol, I)
-    KDE_h_crit = KernelDensity(kernel='gaussian', bandwidth=h_crit).fit(data.reshape(-1, 1))
-    resampling_scale_factor = 1.0/np.sqrt(1+h_crit**2/np.var(data))
     smaller_equal_crit_bandwidth = bootstrap(
-        is_resampled_unimodal_kde, N_bootstrap, np.bool_, comm, KDE_h_crit,
-        resampling_scale_factor, len(data), h_crit*lambda_alpha, lamtol, mtol, I)
-    return np.mean(~smaller_equal_crit_bandwidth)
\ No newline at end of file
+        is_resampled_unimodal_kde, N_bootstrap, np.bool_, comm, data, h_crit,
+        h_crit*lambda_alpha, lamtol, mtol, I)
+    return np.mean(~smaller_equal_crit_bandwidth)
+
+
+def _critical_bandwidth(data, I, mode_tree=None):
+    if mode_tree is None:
+        return critical_bandwidth(data, I)
+    return mode_tree.critical_bandwidth(1)
+
+
+def _cum_distr(data, counts=None):
+    '''
+        EDF (xF, yF) and number of observations N of data, or of the
+        histogram (data, counts) if counts is not None.
+    '''
+    if counts is None:
+        return diptest.cum_distr(data) + (len(data),)
+    return diptest.cum_distr_from_counts(data, counts) + (int(np.sum(counts)),)
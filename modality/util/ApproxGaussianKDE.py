@@ -2,7 +2,7 @@ from __future__ import unicode_literals
 from __future__ import print_function
 
 import numpy as np
-from scipy.stats import norm
+from scipy.special import ndtr
 
 
 class ApproxGaussianKDE(object):
@@ -13,14 +13,30 @@ class ApproxGaussianKDE(object):
         bounded by tol/(h*sqrt(2*pi). This is shown in the accompanying
         documentation "Approxmation of kernel density estimator".
 
+        With truncate=True, only bins within cutoff = sqrt(-2*log(tol))
+        bandwidths of a query point are summed, found by searchsorted
+        in the sorted bin means. Each omitted bin contributes less than
+        tol times its weight to evaluate_prop, so truncation adds at
+        most tol/(h*sqrt(2*pi)) to the error, and the total maximal
+        absolute error is bounded by 2*tol/(h*sqrt(2*pi)). Evaluation
+        then costs O(m*k) instead of O(m*n) for m query points, n bins
+        and at most k bins within the cutoff.
+
         Apart from binning, the implementation mimics that of 
         KernelDensity from sklearn.neighbors.
     """
 
-    def __init__(self, data, bandwidth, tol=1e-4):
+    def __init__(self, data, bandwidth, tol=1e-4, truncate=False, bins=None):
         self.h = bandwidth
         self.kernel = lambda u: np.exp(-u**2/2.0)
         self.data_orig = data
+        self.truncate = truncate
+        self.cutoff = np.sqrt(-2*np.log(tol))
+        if bins is not None:  # (means, counts) with bin width at most sqrt(2*tol)*h
+            self.datah, self.weights = bins
+            self.datah = self.datah/self.h
+            self._norm_factor = np.sqrt(2*np.pi)*self.h*sum(self.weights)
+            return
         data = np.sort(data)
         bin_width = np.sqrt(2*tol)*self.h
         bins = np.arange(data[0]-bin_width/2.0, data[-1]+3*bin_width/2.0, bin_width)
@@ -33,8 +49,20 @@ class ApproxGaussianKDE(object):
         self.datah /= self.h
         self._norm_factor = np.sqrt(2*np.pi)*self.h*sum(self.weights)
 
+    @classmethod
+    def from_pyramid(cls, pyramid, bandwidth, tol=1e-4):
+        """
+            KDE from the bins of a BinningPyramid with width at most
+            sqrt(2*tol)*h, i.e. with the same error bound, without
+            binning the data again. If the pyramid has no such level the
+            data is binned as usual.
+        """
+        return cls(pyramid.data, bandwidth, tol, bins=pyramid.bins(np.sqrt(2*tol)*bandwidth))
+
     def evaluate_prop(self, x):  # returns values proportional to kde.
         xh = np.array(x).reshape(-1)/self.h
+        if self.truncate:
+            return self._evaluate_prop_truncated(xh)
         res = np.zeros(len(xh))
         if len(xh) > len(self.datah):  # loop over data
             for data_, weight in zip(self.datah, self.weights):
@@ -44,6 +72,24 @@ class ApproxGaussianKDE(object):
                 res[i] = np.sum(self.weights*self.kernel(self.datah-x_))
         return res
 
+    def _evaluate_prop_truncated(self, xh):
+        res = np.zeros(len(xh))
+        if len(xh) > len(self.datah):  # loop over data
+            ord = np.argsort(xh)
+            xh_sort = xh[ord]
+            starts = np.searchsorted(xh_sort, self.datah-self.cutoff)
+            ends = np.searchsorted(xh_sort, self.datah+self.cutoff, side='right')
+            res_sort = np.zeros(len(xh))
+            for data_, weight, start, end in zip(self.datah, self.weights, starts, ends):
+                res_sort[start:end] += weight*self.kernel(data_-xh_sort[start:end])
+            res[ord] = res_sort
+        else:  # loop over x
+            starts = np.searchsorted(self.datah, xh-self.cutoff)
+            ends = np.searchsorted(self.datah, xh+self.cutoff, side='right')
+            for i, (x_, start, end) in enumerate(zip(xh, starts, ends)):
+                res[i] = np.sum(self.weights[start:end]*self.kernel(self.datah[start:end]-x_))
+        return res
+
     def evaluate(self, x):
         res = self.evaluate_prop(x)
         return res / self._norm_factor
@@ -52,7 +98,54 @@ class ApproxGaussianKDE(object):
         return np.log(self.evaluate(x))
 
     def distr(self, x):
-        return np.mean(norm.cdf(x - self.data_orig, scale=self.h))
+        """
+            Distribution function at x (scalar or array), computed from
+            the binned data, see binned_distr.
+        """
+        return binned_distr(x, self.datah*self.h, self.weights, self.h)
+
+
+def binned_distr(x, centres, weights, h, tol=1e-4):
+    """
+        Distribution function at x (scalar or array) of a Gaussian
+        kernel density estimate with bandwidth h of data binned at the
+        sorted centres with the given weights. Only bins within
+        sqrt(-2*log(tol)) bandwidths of a query point are evaluated,
+        bins further below (above) are counted as entirely below
+        (above) it, which changes the value by less than tol.
+
+        The windows of all query points are evaluated in one flat array
+        (in blocks of about 2**16 bins), the contributions are then
+        summed per query point with bincount.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    xh = x.reshape(-1)/h
+    centresh = np.asarray(centres, dtype=np.float64)/h
+    weights = np.asarray(weights, dtype=np.float64)
+    cutoff = np.sqrt(-2*np.log(tol))
+    cum_weights = np.hstack([0, np.cumsum(weights)])
+    starts = np.searchsorted(centresh, xh-cutoff)
+    ends = np.searchsorted(centresh, xh+cutoff, side='right')
+    res = cum_weights[starts]
+    cum_widths = np.hstack([0, np.cumsum(ends-starts)])
+    block_ends = np.searchsorted(cum_widths, np.arange(1, cum_widths[-1]//2**16+1)*2**16)
+    for i, j in zip(np.hstack([0, block_ends]), np.hstack([block_ends, len(xh)])):
+        point = np.repeat(np.arange(i, j), ends[i:j]-starts[i:j])
+        ind = starts[point] + np.arange(cum_widths[i], cum_widths[j]) - cum_widths[point]
+        res[i:j] += np.bincount(point-i, weights[ind]*ndtr(xh[point]-centresh[ind]),
+                                minlength=j-i)
+    res /= cum_weights[-1]
+    return res.reshape(x.shape)
+
+
+class TruncatedGaussianKDE(ApproxGaussianKDE):
+    """
+        ApproxGaussianKDE with truncated kernel evaluation.
+    """
+
+    def __init__(self, data, bandwidth, tol=1e-4, bins=None):
+        super(TruncatedGaussianKDE, self).__init__(data, bandwidth, tol, True, bins)
+
 
 if __name__ == '__main__':
     from scipy.stats import gaussian_kde
@@ -0,0 +1,66 @@
+from __future__ import unicode_literals
+from __future__ import division
+
+import numpy as np
+
+
+class BinningPyramid(object):
+    '''
+        Binned representation of a one-dimensional data set at dyadic
+        bin widths, built once per data set so that kernel density
+        estimates for many bandwidths, e.g. in the bisection for the
+        critical bandwidth, can be formed without sorting or binning
+        the data again.
+
+        Level k has bins of width w0*2**k starting at min(data), where
+        w0 = (max(data)-min(data))/2**nbr_levels, with the number of data
+        points and the mean of the data in each nonempty bin. The level
+        for a requested maximal bin width is found in O(1).
+
+        Input:
+            data        -   one-dimensional data set.
+            nbr_levels  -   number of levels below the single bin
+                            covering all data.
+    '''
+
+    def __init__(self, data, nbr_levels=16):
+        self.data = np.sort(np.asarray(data, dtype=np.float64).ravel())
+        self.min = self.data[0]
+        self.max = self.data[-1]
+        self.nbr_levels = nbr_levels
+        nbr_bins = 2**nbr_levels
+        self.w0 = (self.max-self.min)/nbr_bins
+        if self.w0 == 0:
+            self.w0 = 1.
+        ind = np.minimum(((self.data-self.min)/self.w0).astype(np.int64), nbr_bins-1)
+        counts = np.bincount(ind, minlength=nbr_bins).astype(np.float64)
+        sums = np.bincount(ind, self.data, minlength=nbr_bins)
+        self.levels = []
+        for k in range(nbr_levels+1):
+            nonempty = counts > 0
+            self.levels.append((sums[nonempty]/counts[nonempty], counts[nonempty]))
+            counts = counts[::2] + counts[1::2]
+            sums = sums[::2] + sums[1::2]
+
+    def bin_width(self, k):
+        return self.w0*2**k
+
+    def level(self, max_bin_width):
+        '''
+            Coarsest level with bins not wider than max_bin_width, None
+            if the finest bins are too wide.
+        '''
+        if max_bin_width < self.w0:
+            return None
+        return min(int(np.log2(max_bin_width/self.w0)), self.nbr_levels)
+
+    def bins(self, max_bin_width):
+        '''
+            (means, counts) of the nonempty bins at the coarsest level
+            with bins not wider than max_bin_width, None if there is no
+            such level.
+        '''
+        k = self.level(max_bin_width)
+        if k is None:
+            return None
+        return self.levels[k]
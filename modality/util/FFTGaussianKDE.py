@@ -0,0 +1,90 @@
+from __future__ import unicode_literals
+from __future__ import division
+
+import numpy as np
+from scipy.signal import fftconvolve
+
+from .ApproxGaussianKDE import binned_distr
+
+
+class FFTGaussianKDE(object):
+    """
+        Approximate Gaussian kernel density estimate, evaluated on a
+        regular grid by linear binning of the data and FFT convolution
+        with the sampled kernel, in O(G log G) time for G grid points.
+        Between grid points the estimate is interpolated linearly.
+
+        The grid spacing is sqrt(2*tol)*h. Linear binning and linear
+        interpolation each change the contribution of a data point by
+        at most spacing**2/(8*h**2) = tol/4 times the maximum of the
+        kernel, and the kernel is truncated where it is below tol/2,
+        so the maximal absolute error is bounded by tol/(h*sqrt(2*pi)),
+        the same bound as for ApproxGaussianKDE. Values below 1e-10
+        times the total weight, where rounding errors from the FFT are
+        of the same order as the value, are set to zero.
+
+        Same interface as ApproxGaussianKDE, so it can be used for
+        mode counting in critical_bandwidth and critical_bandwidth_fm.
+
+        Input:
+            data        -   one-dimensional data set.
+            bandwidth   -   bandwidth h.
+            tol         -   error tolerance, see above.
+            weights     -   weights of the data points, if None all
+                            data points have weight one.
+    """
+
+    def __init__(self, data, bandwidth, tol=1e-4, weights=None):
+        self.h = bandwidth
+        self.data_orig = data
+        data = np.asarray(data, dtype=np.float64).ravel()
+        if weights is None:
+            weights = np.ones(len(data))
+        weights = np.asarray(weights, dtype=np.float64).ravel()
+        self.dx = np.sqrt(2*tol)*self.h
+        cutoff = np.sqrt(-2*np.log(tol/2))
+        nbr_kernel = int(np.ceil(cutoff*self.h/self.dx))
+        self.x0 = np.min(data) - nbr_kernel*self.dx
+        nbr_grid = int(np.ceil((np.max(data)-self.x0)/self.dx)) + nbr_kernel + 2
+        self.grid = self.x0 + np.arange(nbr_grid)*self.dx
+
+        pos = (data-self.x0)/self.dx
+        ind = np.floor(pos).astype(np.int64)
+        frac = pos - ind
+        self.grid_weights = (np.bincount(ind, weights*(1-frac), minlength=nbr_grid) +
+                             np.bincount(ind+1, weights*frac, minlength=nbr_grid))
+
+        kernel = np.exp(-(np.arange(-nbr_kernel, nbr_kernel+1)*self.dx/self.h)**2/2.0)
+        self.grid_values = fftconvolve(self.grid_weights, kernel, mode='same')
+        self.grid_values[self.grid_values < 1e-10*np.sum(weights)] = 0
+        self._norm_factor = np.sqrt(2*np.pi)*self.h*np.sum(weights)
+
+    @classmethod
+    def from_pyramid(cls, pyramid, bandwidth, tol=1e-4):
+        """
+            KDE from the bin means and counts of a BinningPyramid with
+            width at most sqrt(tol)*h, which contributes at most tol/2
+            to the error, and a grid with tolerance tol/2.
+        """
+        bins = pyramid.bins(np.sqrt(tol)*bandwidth)
+        if bins is None:
+            return cls(pyramid.data, bandwidth, tol)
+        means, counts = bins
+        kde = cls(means, bandwidth, tol/2, weights=counts)
+        kde.data_orig = pyramid.data
+        return kde
+
+    def evaluate_prop(self, x):  # returns values proportional to kde.
+        xh = np.array(x, dtype=np.float64).reshape(-1)
+        return np.interp(xh, self.grid, self.grid_values, left=0, right=0)
+
+    def evaluate(self, x):
+        res = self.evaluate_prop(x)
+        return res / self._norm_factor
+
+    def score_samples(self, x):
+        return np.log(self.evaluate(x))
+
+    def distr(self, x):
+        nonzero = self.grid_weights > 0
+        return binned_distr(x, self.grid[nonzero], self.grid_weights[nonzero], self.h)
@@ -0,0 +1,121 @@
+from __future__ import unicode_literals
+from __future__ import division
+
+import numpy as np
+from scipy.special import factorial
+
+from .ApproxGaussianKDE import binned_distr
+
+
+class FastGaussTransformKDE(object):
+    """
+        Gaussian kernel density estimate evaluated with an improved
+        fast Gauss transform: the data is grouped in clusters of width
+        s = sqrt(2)*h, and the contribution of each cluster is expanded
+        in a Taylor series of order p around the cluster centre c,
+
+            sum_i w_i exp(-(y-x_i)**2/s**2)
+                = exp(-b**2) sum_{n<p} C_n b**n + error,
+            C_n = 2**n/n! sum_i w_i exp(-a_i**2) a_i**n,
+
+        with a_i = (x_i-c)/s, b = (y-c)/s. Clusters further than r_y
+        from a query point are skipped. Per unit weight, the truncation
+        of the series is bounded by (2*r_x*r_y/s**2)**p/p! (r_x = s/2
+        is the cluster radius), and the skipped clusters by
+        exp(-(r_y-r_x)**2/s**2). r_y and p are chosen so that both are
+        at most tol/2, so the maximal absolute error is bounded by
+        tol/(h*sqrt(2*pi)), as for ApproxGaussianKDE.
+
+        Forming the expansions costs O(N*p) and evaluating M points
+        O(M*p*r_y/s), i.e. O(N+M) for fixed tol.
+
+        Same interface as ApproxGaussianKDE, so it can be used for mode
+        counting in critical_bandwidth and critical_bandwidth_fm.
+
+        Input:
+            data        -   one-dimensional data set.
+            bandwidth   -   bandwidth h.
+            tol         -   error tolerance, see above.
+            weights     -   weights of the data points, if None all
+                            data points have weight one.
+    """
+
+    def __init__(self, data, bandwidth, tol=1e-4, weights=None):
+        self.h = bandwidth
+        self.data_orig = data
+        self.weights_orig = weights
+        self._distr_bins = None
+        data = np.asarray(data, dtype=np.float64).ravel()
+        if weights is None:
+            weights = np.ones(len(data))
+        self.weights = np.asarray(weights, dtype=np.float64).ravel()
+        self.s = np.sqrt(2)*self.h
+        r_x = self.s/2
+        self.r_y = r_x + self.s*np.sqrt(np.log(2/tol))
+        self.p = 1
+        while (2*r_x*self.r_y/self.s**2)**self.p/factorial(self.p) > tol/2:
+            self.p += 1
+
+        self.x0 = np.min(data)
+        self.cluster_width = 2*r_x
+        cluster = ((data-self.x0)/self.cluster_width).astype(np.int64)
+        self.nbr_clusters = np.max(cluster)+1
+        self.centres = self.x0 + (np.arange(self.nbr_clusters)+0.5)*self.cluster_width
+        a = (data-self.centres[cluster])/self.s
+        term = self.weights*np.exp(-a**2)
+        self.coeffs = np.empty((self.nbr_clusters, self.p))
+        for n in range(self.p):
+            self.coeffs[:, n] = 2**n/factorial(n)*np.bincount(
+                cluster, term, minlength=self.nbr_clusters)
+            term = term*a
+        self._norm_factor = np.sqrt(2*np.pi)*self.h*np.sum(self.weights)
+
+    @classmethod
+    def from_pyramid(cls, pyramid, bandwidth, tol=1e-4):
+        """
+            KDE from the bin means and counts of a BinningPyramid with
+            width at most sqrt(tol)*h, which contributes at most tol/2
+            to the error, and expansions with tolerance tol/2.
+        """
+        bins = pyramid.bins(np.sqrt(tol)*bandwidth)
+        if bins is None:
+            return cls(pyramid.data, bandwidth, tol)
+        means, counts = bins
+        kde = cls(means, bandwidth, tol/2, weights=counts)
+        kde.data_orig = pyramid.data
+        kde.weights_orig = None
+        return kde
+
+    def evaluate_prop(self, x):  # returns values proportional to kde.
+        xh = np.array(x, dtype=np.float64).reshape(-1)
+        res = np.zeros(len(xh))
+        cluster = np.floor((xh-self.x0)/self.cluster_width).astype(np.int64)
+        reach = int(np.ceil(self.r_y/self.cluster_width))
+        for offset in range(-reach, reach+1):
+            k = cluster + offset
+            b = (xh-self.centres[np.clip(k, 0, self.nbr_clusters-1)])/self.s
+            near = (k >= 0) & (k < self.nbr_clusters) & (np.abs(b) <= self.r_y/self.s)
+            if not near.any():
+                continue
+            k = k[near]
+            b = b[near]
+            series = self.coeffs[k, self.p-1]
+            for n in range(self.p-2, -1, -1):  # Horner's scheme
+                series = series*b + self.coeffs[k, n]
+            res[near] += np.exp(-b**2)*series
+        return res
+
+    def evaluate(self, x):
+        res = self.evaluate_prop(x)
+        return res / self._norm_factor
+
+    def score_samples(self, x):
+        return np.log(self.evaluate(x))
+
+    def distr(self, x):
+        if self._distr_bins is None:
+            data = np.asarray(self.data_orig, dtype=np.float64).ravel()
+            weights = np.ones(len(data)) if self.weights_orig is None else self.weights_orig
+            order = np.argsort(data)
+            self._distr_bins = data[order], np.asarray(weights, dtype=np.float64)[order]
+        return binned_distr(x, self._distr_bins[0], self._distr_bins[1], self.h)
@@ -32,8 +32,9 @@ class GaussianMixture1d(object):
     def score_samples(self, x):
         return np.log(self.evaluate(x))
 
-    def distr(self, x):
-        return np.sum(self.pis*norm.cdf((x - self.mus)/self.sigmas))
+    def distr(self, x):  # x is a scalar or an array
+        x = np.asarray(x)
+        return np.sum(self.pis*norm.cdf((x[..., np.newaxis] - self.mus)/self.sigmas), axis=-1)
 
     def sample(self, n):
         ns = np.random.multinomial(n, self.pis)
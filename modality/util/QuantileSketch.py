@@ -0,0 +1,92 @@
+from __future__ import unicode_literals
+from __future__ import division
+
+import numpy as np
+
+
+class QuantileSketch(object):
+    '''
+        Mergeable quantile sketch of a stream of one-dimensional data,
+        in the style of the KLL sketch but with deterministic
+        compactions, so that its rank error has a rigorous bound.
+
+        Level h holds items of weight 2**h. When a level holds more
+        than k items, an even number of them is compacted: they are
+        sorted and every other item (alternately starting with the
+        first and the second) is moved to level h+1. For any x this
+        changes the total weight of items <= x by at most 2**h, so
+        rank_error is increased by 2**h. Hence for all x the number of
+        observations <= x differs from the total weight of items <= x
+        by at most rank_error, i.e. the distribution function of the
+        sketch is within cdf_error = rank_error/n of the empirical
+        distribution function of the data. The sketch holds
+        O(k log(n/k)) items and cdf_error is O(log(n/k)/k).
+
+        Sketches of different parts of the data (chunks, workers) can
+        be merged, and the merged sketch has the same guarantee.
+
+        Input:
+            k   -   maximal number of items on a level before it is
+                    compacted.
+    '''
+
+    def __init__(self, k=4096):
+        self.k = k
+        self.levels = []
+        self.offsets = []
+        self.n = 0
+        self.rank_error = 0
+
+    @property
+    def cdf_error(self):
+        return self.rank_error/self.n
+
+    def update(self, data):
+        '''
+            Add the observations in data (array) to the sketch.
+        '''
+        data = np.asarray(data, dtype=np.float64).ravel()
+        self._add(0, data)
+        self.n += len(data)
+        self._compact()
+        return self
+
+    def merge(self, other):
+        '''
+            Add the observations summarised by the sketch other to the
+            sketch.
+        '''
+        for h, items in enumerate(other.levels):
+            self._add(h, items)
+        self.n += other.n
+        self.rank_error += other.rank_error
+        self._compact()
+        return self
+
+    def items_and_weights(self):
+        '''
+            Items in the sketch and their weights, the weights sum to n.
+        '''
+        items = np.hstack([np.zeros(0)]+self.levels)
+        weights = np.hstack([np.zeros(0)]+[np.full(len(level_items), 2.**h)
+                                            for h, level_items in enumerate(self.levels)])
+        return items, weights
+
+    def _add(self, h, items):
+        while len(self.levels) <= h:
+            self.levels.append(np.zeros(0))
+            self.offsets.append(0)
+        self.levels[h] = np.hstack([self.levels[h], items])
+
+    def _compact(self):
+        h = 0
+        while h < len(self.levels):
+            items = self.levels[h]
+            if len(items) > self.k:
+                items = np.sort(items)
+                m = len(items) - len(items) % 2
+                self._add(h+1, items[self.offsets[h]:m:2])
+                self.levels[h] = items[m:]
+                self.offsets[h] = 1 - self.offsets[h]
+                self.rank_error += 2**h
+            h += 1
@@ -0,0 +1,117 @@
+from __future__ import unicode_literals
+from __future__ import division
+
+import numpy as np
+
+
+class SortedBlocks(object):
+    '''
+        Sorted multiset of floats, e.g. a sliding window of a stream,
+        from which values are inserted and removed in batches.
+
+        The values are kept in consecutive sorted blocks of at most
+        2*block_size values. A value is routed to its block by binary
+        search over the block maxima, and only the blocks that receive
+        or lose values are rewritten, so a batch of r values costs
+        O(r log n + k*block_size) for k touched blocks, instead of O(n)
+        for one sorted array. Blocks that grow beyond 2*block_size are
+        split and blocks that shrink below block_size/2 are merged with
+        a neighbour. The values are copied into one sorted array only
+        on request (to_array).
+
+        Each touched block costs a few NumPy calls, which take about as
+        long as moving a few thousand values, hence the default
+        block_size. Smaller multisets are held in a single block.
+
+        Input:
+            block_size  -   typical number of values in a block.
+    '''
+
+    def __init__(self, block_size=4096):
+        self.block_size = block_size
+        self.blocks = []
+        self._maxima = np.zeros(0)
+        self._offsets = np.zeros(1, dtype=np.int64)
+
+    def __len__(self):
+        return int(self._offsets[-1])
+
+    def insert(self, values):
+        '''
+            Insert values (array).
+        '''
+        values = np.sort(np.asarray(values, dtype=np.float64).ravel())
+        if len(values) == 0:
+            return
+        if len(self.blocks) == 0:
+            self.blocks = [values]
+            self._rebalance([0])
+            return
+        block = np.minimum(np.searchsorted(self._maxima, values), len(self.blocks)-1)
+        touched, starts = np.unique(block, return_index=True)
+        ends = np.hstack([starts[1:], len(values)])
+        for b, start, end in zip(touched, starts, ends):
+            blk = self.blocks[b]
+            self.blocks[b] = np.insert(blk, np.searchsorted(blk, values[start:end]),
+                                       values[start:end])
+        self._rebalance(touched)
+
+    def remove(self, values):
+        '''
+            Remove values (array), one copy for each occurrence in
+            values. Raises ValueError if a value is not present.
+        '''
+        values = np.sort(np.asarray(values, dtype=np.float64).ravel())
+        if len(values) == 0:
+            return
+        block = np.searchsorted(self._maxima, values)
+        if block[-1] >= len(self.blocks):
+            raise ValueError('Value {} not present'.format(values[-1]))
+        # position of the first copy of each value, copies of a value
+        # are removed from consecutive positions (possibly in several
+        # blocks)
+        first = np.empty(len(values), dtype=np.int64)
+        touched, starts = np.unique(block, return_index=True)
+        ends = np.hstack([starts[1:], len(values)])
+        for b, start, end in zip(touched, starts, ends):
+            first[start:end] = self._offsets[b] + np.searchsorted(self.blocks[b],
+                                                                  values[start:end])
+        pos = first + np.arange(len(values)) - np.searchsorted(values, values)
+        if pos[-1] >= len(self):
+            raise ValueError('Value {} not present'.format(values[-1]))
+        block = np.searchsorted(self._offsets, pos, side='right') - 1
+        touched, starts = np.unique(block, return_index=True)
+        ends = np.hstack([starts[1:], len(values)])
+        local = pos - self._offsets[block]
+        blocks = [np.delete(self.blocks[b], local[start:end])
+                  for b, start, end in zip(touched, starts, ends)
+                  if np.array_equal(self.blocks[b][local[start:end]], values[start:end])]
+        if len(blocks) < len(touched):
+            raise ValueError('Values not present')
+        for b, blk in zip(touched, blocks):
+            self.blocks[b] = blk
+        self._rebalance(touched)
+
+    def to_array(self):
+        '''
+            All values as one sorted array.
+        '''
+        if len(self.blocks) == 0:
+            return np.zeros(0)
+        return np.concatenate(self.blocks)
+
+    def _rebalance(self, touched):
+        for b in sorted(touched, reverse=True):
+            blk = self.blocks[b]
+            if len(blk) < self.block_size//2 and len(self.blocks) > 1:
+                # merge with the following block (or the preceding for the last block)
+                b = b if b+1 < len(self.blocks) else b-1
+                blk = np.concatenate(self.blocks[b:b+2])
+                self.blocks[b:b+2] = [blk]
+            if len(blk) > 2*self.block_size:
+                nbr = len(blk)//self.block_size
+                self.blocks[b:b+1] = np.array_split(blk, nbr)
+            elif len(blk) == 0:
+                del self.blocks[b]
+        self._maxima = np.array([blk[-1] for blk in self.blocks])
+        self._offsets = np.hstack([0, np.cumsum([len(blk) for blk in self.blocks])]).astype(np.int64)
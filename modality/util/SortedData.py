@@ -0,0 +1,59 @@
+from __future__ import unicode_literals
+from __future__ import division
+
+import numpy as np
+
+
+class SortedData(object):
+    '''
+        One-dimensional data set sorted once, from which sorted subsets,
+        e.g. the events in each node of a gating tree or each cluster,
+        are extracted without sorting again.
+
+        A subset given as a boolean mask is extracted by reading the
+        mask in the global order, in O(N) time without comparisons. A
+        subset given as k indices is extracted by sorting the ranks of
+        the indices, i.e. k integers, which for large k is instead done
+        through a mask.
+
+        Input:
+            data    -   one-dimensional data set.
+    '''
+
+    def __init__(self, data):
+        data = np.asarray(data, dtype=np.float64).ravel()
+        self.order = np.argsort(data, kind='mergesort')
+        self.data_sort = data[self.order]
+        self.rank = np.empty(len(data), dtype=np.int64)
+        self.rank[self.order] = np.arange(len(data))
+
+    def __len__(self):
+        return len(self.data_sort)
+
+    def subset(self, subset):
+        '''
+            Sorted values of data[subset], where subset is a boolean
+            mask or an array of indices.
+        '''
+        subset = np.asarray(subset)
+        if subset.dtype == np.bool_:
+            if subset.shape != self.data_sort.shape:
+                raise ValueError('Mask of length {} for data of length {}'.format(
+                    len(subset), len(self)))
+            return self.data_sort[subset[self.order]]
+        if 16*len(subset) > len(self):
+            counts = np.bincount(self.rank[subset], minlength=len(self))
+            return np.repeat(self.data_sort, counts)
+        return self.data_sort[np.sort(self.rank[subset])]
+
+    def sorted_masks(self, masks):
+        '''
+            Boolean masks (rows of masks) permuted to the sorted order,
+            in one call, so that data_sort[sorted_masks[i]] are the
+            sorted values of data[masks[i]].
+        '''
+        masks = np.asarray(masks, dtype=np.bool_)
+        if masks.ndim != 2 or masks.shape[1] != len(self):
+            raise ValueError('Masks must be a two-dimensional array with {} '
+                             'columns'.format(len(self)))
+        return masks[:, self.order]
@@ -3,7 +3,17 @@ from .MC_error_check import MC_error_check
 from .printutil import print_all_ranks, print_rank0
 from .auto_interval import auto_interval, get_I
 from .frequency_polygon_blurring import fp_blurring
-from .ApproxGaussianKDE import ApproxGaussianKDE
+from .ApproxGaussianKDE import ApproxGaussianKDE, TruncatedGaussianKDE
+from .FFTGaussianKDE import FFTGaussianKDE
+from .FastGaussTransformKDE import FastGaussTransformKDE
+from .BinningPyramid import BinningPyramid
+from .QuantileSketch import QuantileSketch
+from .SortedData import SortedData
+from .SortedBlocks import SortedBlocks
+from .smoothed_bootstrap import smoothed_bootstrap
 
 __all__ = ['MC_error_check', 'print_all_ranks', 'print_rank0',
-           'fp_blurring', 'auto_interval', 'get_I', 'ApproxGaussianKDE']
+           'fp_blurring', 'auto_interval', 'get_I', 'ApproxGaussianKDE',
+           'TruncatedGaussianKDE', 'FFTGaussianKDE', 'FastGaussTransformKDE',
+           'BinningPyramid', 'QuantileSketch', 'SortedData', 'SortedBlocks',
+           'smoothed_bootstrap']
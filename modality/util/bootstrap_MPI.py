@@ -1,11 +1,11 @@
 from __future__ import unicode_literals
 from __future__ import print_function
 
-from mpi4py import MPI
 import numpy as np
 from scipy.stats import binom
 
 from . import print_rank0
+from .mpi_comm import comm_self, comm_world
 # from . import print_all_ranks
 
 #comm = MPI.COMM_WORLD
@@ -40,7 +40,8 @@ def check_equal_mpi(comm, val):
         raise ValueError('Not same data across workers.')
 
 
-def bootstrap(fun, N, dtype=np.float_, comm=MPI.COMM_SELF, *args):
+def bootstrap(fun, N, dtype=np.float_, comm=None, *args):
+    comm = comm_self(comm)
     rank = comm.Get_rank()
     size = comm.Get_size()
     #seed = np.random.randint(100000)+rank
@@ -59,6 +60,30 @@ def bootstrap(fun, N, dtype=np.float_, comm=MPI.COMM_SELF, *args):
     return res
 
 
+def bootstrap_batch(fun, N, dtype=np.float_, comm=None, max_batch=100, *args):
+    '''
+        Same as bootstrap, but fun(n, *args) returns n bootstrap
+        values at once, so each worker makes one call per batch of at
+        most max_batch values instead of one call per value.
+    '''
+    comm = comm_self(comm)
+    rank = comm.Get_rank()
+    size = comm.Get_size()
+    res_loc = np.array_split(np.zeros((N,), dtype=dtype), size)
+    res_loc = comm.scatter(res_loc)
+    args = comm.bcast(args)
+    for i in range(0, len(res_loc), max_batch):
+        n = min(max_batch, len(res_loc)-i)
+        res_loc[i:(i+n)] = fun(n, *args)
+    res_loc = comm.gather(res_loc)
+    if rank == 0:
+        res = np.hstack(res_loc)
+    else:
+        res = None
+    res = comm.bcast(res)
+    return res
+
+
 def bootstrap_array(fun, N, l, dtype=np.float_, *args):
     res = np.zeros((N, l), dtype=dtype)
     for i in range(res.shape[0]):
@@ -68,8 +93,9 @@ def bootstrap_array(fun, N, l, dtype=np.float_, *args):
 
 def probability_in_interval(fun_resample, gamma_lower, gamma_upper,
                             significance_first=0.01, significance_second=0.05,
-                            batch=5, comm=MPI.COMM_SELF,
+                            batch=5, comm=None,
                             print_per_batch=False, printing=True):
+    comm = comm_self(comm)
     N_test_max = 20000
     vals = np.zeros((0,))
     s = "gamma_lower, gamma_upper = {}, {}".format(gamma_lower, gamma_upper)
@@ -114,19 +140,24 @@ def probability_in_interval(fun_resample, gamma_lower, gamma_upper,
             s = "gamma_lower, gamma_upper = {}, {}".format(gamma_lower, gamma_upper)
 
 
-def probability_above(fun_resample, gamma, max_samp=None, comm=MPI.COMM_SELF,
+def probability_above(fun_resample, gamma, max_samp=None, comm=None,
                       batch=5, tol=0, bound_significance=0.01, print_per_batch=False,
-                      exception_at_max_samp=False, printing=True):
+                      exception_at_max_samp=False, printing=True, vectorized=False):
     '''
         Returns True if P(fun_resample()) is significantly above gamma,
         returns False if P(fun_resample()) is significantly below gamma.
         Increases samples size until significance is obtained.
         (null hypothesis is p = gamma).
+
+        If vectorized is True, fun_resample(n) returns n samples at
+        once (see bootstrap_batch).
     '''
+    comm = comm_self(comm)
+    bootstrap_fun = bootstrap_batch if vectorized else bootstrap
     vals = np.zeros((0,))
     s = "gamma = {}".format(gamma)
     while True:
-        vals_new_samp = bootstrap(fun_resample, batch, comm=comm, dtype=np.bool_)
+        vals_new_samp = bootstrap_fun(fun_resample, batch, comm=comm, dtype=np.bool_)
         #if True:#gamma == 0.05:
         #    print_all_ranks(comm, str(vals_new_samp))
         #vals_new_samp = vals_new_samp[~np.isnan(vals_new_samp)]
@@ -172,7 +203,7 @@ if __name__ == '__main__':
             return 0.01*np.abs(np.random.randn(1))+arg1+arg2
 
         N = 5
-        print("bootstrap(testfun, N, rank, size) = {}".format(bootstrap(testfun, N, np.float_, MPI.COMM_WORLD, rank, size)))
+        print("bootstrap(testfun, N, rank, size) = {}".format(bootstrap(testfun, N, np.float_, comm_world(), rank, size)))
 
     def testfun():
         alpha = 0.08
@@ -0,0 +1,50 @@
+'''
+    Optional just-in-time compilation of loop-based kernels.
+
+    Kernels decorated with jit are compiled with numba when it is
+    installed and run as ordinary Python functions otherwise, so numba
+    only affects speed, never results. The decorated functions should
+    therefore only use the subset of Python and NumPy that numba
+    supports in nopython mode, and should not call each other.
+
+    numba is imported and the kernel compiled at the first call, not
+    when the decorated module is imported.
+'''
+from __future__ import unicode_literals
+
+import functools
+
+
+def jit(fun):
+    compiled = []
+
+    @functools.wraps(fun)
+    def wrapper(*args):
+        if not compiled:
+            compiled.append(_compile(fun))
+        return compiled[0](*args)
+    return wrapper
+
+
+def _compile(fun):
+    try:
+        from numba import njit
+    except ImportError:
+        return fun
+    try:
+        return njit(cache=True)(fun)
+    except RuntimeError:  # no location to cache compiled function
+        return njit(fun)
+
+
+def numba_available():
+    '''
+        True if jit compiles kernels, i.e. if numba can be imported.
+        Used to pick a vectorized NumPy implementation instead of a
+        kernel whose pure Python version would be too slow.
+    '''
+    try:
+        import numba  # noqa: F401
+    except ImportError:
+        return False
+    return True
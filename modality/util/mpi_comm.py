@@ -0,0 +1,29 @@
+'''
+    Default MPI communicators, resolved when first needed.
+
+    Functions taking a communicator use comm=None as default and
+    resolve it with comm_world or comm_self, so that mpi4py (and
+    thereby MPI) is only imported when a communicator is actually
+    used, not when modality is imported.
+'''
+from __future__ import unicode_literals
+
+
+def comm_world(comm=None):
+    '''
+        comm, or MPI.COMM_WORLD if comm is None.
+    '''
+    if comm is None:
+        from mpi4py import MPI
+        comm = MPI.COMM_WORLD
+    return comm
+
+
+def comm_self(comm=None):
+    '''
+        comm, or MPI.COMM_SELF if comm is None.
+    '''
+    if comm is None:
+        from mpi4py import MPI
+        comm = MPI.COMM_SELF
+    return comm
@@ -1,13 +1,13 @@
 from __future__ import unicode_literals
 from __future__ import print_function
 
-from mpi4py import MPI
+from .mpi_comm import comm_world
 
 
 def print_rank0(comm, str):
     if comm.Get_rank() == 0:
         lines = str.split('\n')
-        prefix = '{:02d}: '.format(MPI.COMM_WORLD.Get_rank())
+        prefix = '{:02d}: '.format(comm_world().Get_rank())
         str = ('\n'+prefix).join(lines)
         str = prefix+str
         print(str)
@@ -15,4 +15,4 @@ def print_rank0(comm, str):
 
 def print_all_ranks(comm, msg):
     print("Rank {}({}): ".format(comm.Get_rank(),
-          MPI.COMM_WORLD.Get_rank())+msg)
+          comm_world().Get_rank())+msg)
@@ -0,0 +1,42 @@
+from __future__ import unicode_literals
+from __future__ import division
+
+import numpy as np
+
+
+def smoothed_bootstrap(data, h, B=1, n=None, dtype=np.float64):
+    """
+        B smoothed bootstrap samples from data, i.e. samples from the
+        Gaussian kernel density estimate of data with bandwidth h,
+        rescaled by 1/sqrt(1+h**2/var(data)) as in Silverman's
+        bandwidth test.
+
+        The samples are filled in chunks of rows, for each chunk data
+        indices and Gaussian noise are drawn at once, and the variance
+        correction is applied in place, without fitting a density
+        estimator. Only the B x n output is allocated in full, so with
+        dtype=np.float32 the samples take half the memory.
+
+        Input:
+            data    -   one-dimensional data set.
+            h       -   bandwidth.
+            B       -   number of samples.
+            n       -   size of each sample, len(data) if None.
+            dtype   -   floating point type of the samples.
+
+        Value:
+            B x n array, one sample per row.
+    """
+    data = np.asarray(data, dtype=np.float64).ravel()
+    if n is None:
+        n = len(data)
+    scale = 1./np.sqrt(1+h**2/np.var(data))
+    data = data.astype(dtype)
+    samples = np.empty((B, n), dtype=dtype)
+    rows = max(1, 2**20//max(n, 1))
+    for start in range(0, B, rows):
+        block = samples[start:start+rows]
+        np.take(data, np.random.randint(len(data), size=block.shape), out=block)
+        block += (h*np.random.randn(*block.shape)).astype(dtype, copy=False)
+        block *= dtype(scale)
+    return samples
@@ -14,6 +14,14 @@ if 'install' in sys.argv or 'develop' in sys.argv:
         subprocess.check_output(['Rscript', 'write_qdiptab.R'])
         modality_data += ['data/qDiptab.csv']
         print("Tabluated p-values for Hartigan's diptest included.")
+        try:
+            subprocess.check_output([
+                sys.executable, '-c',
+                'from modality.diptest import convert_dip_table; convert_dip_table()'])
+            modality_data += ['data/qDiptab.npy']
+        except:
+            print("Binary table of p-values for Hartigan's diptest not "
+                  "written, the csv table will be used.")
     except:
         traceback.print_exc()
         print("Tabulated p-values for Hartigan's diptest not loaded due to "
@@ -33,6 +41,7 @@ setup(name='modality',
       package_data={'modality': modality_data,
                     'modality.calibration': ['data/*.pkl']},
       install_requires=REQUIRED_PACKAGES,
+      extras_require={'jit': ['numba']},
       classifiers=[
           # Specify the Python versions you support here. In particular, ensure
           # that you indicate whether you support Python 2, Python 3 or both.
@@ -0,0 +1,129 @@
+from __future__ import unicode_literals
+from __future__ import print_function
+
+import time
+import unittest
+
+import numpy as np
+
+from modality.critical_bandwidth import critical_bandwidth, critical_bandwidth_m_modes, \
+    kde_engines, bisection_search_unimodal, ModeTree, critical_bandwidth_exact, \
+    kde_has_at_most_m_modes, is_unimodal_kde, is_unimodal_kde_batch, \
+    kde_has_at_most_m_modes_batch
+from modality.best_split import best_split
+from modality.critical_bandwidth_fm import mode_sizes_kde, fisher_marron_critical_bandwidth, \
+    bisection_search_unimodal as bisection_search_unimodal_fm
+
+
+class TestCriticalBandwidth(unittest.TestCase):
+
+    def setUp(self):
+        self.data = np.hstack([np.random.randn(5000), np.random.randn(2500)+4])
+
+    def test_kde_engines(self):
+        h_crits = {}
+        for engine in kde_engines:
+            t0 = time.time()
+            h_crits[engine] = (critical_bandwidth(self.data, kde_engine=engine),
+                               critical_bandwidth_m_modes(self.data, 2, kde_engine=engine))
+            t1 = time.time()
+            print("Time for critical bandwidths with KDE engine '{}': {}".format(engine, t1-t0))
+            mode_sizes = mode_sizes_kde(0.2, self.data, 0.01, 0.01, kde_engine=engine)
+            self.assertEqual(len(mode_sizes), 2)
+        for engine in kde_engines:
+            self.assertTrue(np.allclose(h_crits[engine], h_crits['binned'], atol=2e-3))
+        self.assertRaises(ValueError, critical_bandwidth, self.data, kde_engine='exact')
+
+    def test_binning_pyramid(self):
+        hmax = (np.max(self.data)-np.min(self.data))/2
+        I = (np.min(self.data), np.max(self.data))
+        t0 = time.time()
+        h_crit = bisection_search_unimodal(0, hmax, 1e-3, self.data, I)
+        t1 = time.time()
+        h_crit_pyr = critical_bandwidth(self.data, I)
+        t2 = time.time()
+        print("Speedup for critical bandwidth with binning pyramid: {}".format((t1-t0)/(t2-t1)))
+        self.assertAlmostEqual(h_crit, h_crit_pyr, delta=2e-3)
+        h_crit_fm = bisection_search_unimodal_fm(0, hmax, 1e-3, self.data, 0.01, 0.01, I)
+        h_crit_fm_pyr = fisher_marron_critical_bandwidth(self.data, 0.01, 0.01, I)
+        self.assertAlmostEqual(h_crit_fm, h_crit_fm_pyr, delta=2e-3)
+
+    def test_best_split(self):
+        split = best_split(self.data)
+        h_crit = critical_bandwidth_m_modes(self.data, 2)
+        x = np.linspace(np.min(self.data), np.max(self.data), 200)
+        y = np.sum(np.exp(-(x[:, np.newaxis]-self.data)**2/(2*h_crit**2)), axis=1)
+        inside = (x > 0) & (x < 4)
+        self.assertAlmostEqual(split[0], x[inside][np.argmin(y[inside])])
+
+    def test_mode_tree(self):
+        data = np.hstack([self.data, np.random.randn(1000)/2+8])
+        for I in [(-np.inf, np.inf), (-1.5, 9)]:
+            t0 = time.time()
+            mode_tree = ModeTree(data, I)
+            h_crits = mode_tree.critical_bandwidths([1, 2, 3])
+            t1 = time.time()
+            h_crits_bisection = [critical_bandwidth_m_modes(data, m, I) for m in [1, 2, 3]]
+            t2 = time.time()
+            print("Speedup for critical bandwidths with mode tree: {}".format((t2-t1)/(t1-t0)))
+            self.assertTrue(np.allclose(h_crits, h_crits_bisection, atol=2e-3))
+            self.assertTrue(np.all(np.diff(h_crits) < 0))
+            self.assertEqual(mode_tree.nbr_modes(h_crits[1]+2e-3), 2)
+            self.assertEqual(mode_tree.critical_bandwidth(2), h_crits[1])
+        mode_tree = ModeTree(self.data)
+        self.assertAlmostEqual(best_split(self.data, mode_tree=mode_tree)[0],
+                               best_split(self.data)[0], delta=0.05)
+        self.assertRaises(ValueError, ModeTree, np.ones(10))
+
+    def test_critical_bandwidth_exact(self):
+        mode_tree = ModeTree(self.data)
+        for m in [1, 2]:
+            t0 = time.time()
+            h_crit = critical_bandwidth_exact(self.data, m, mode_tree=mode_tree)
+            t1 = time.time()
+            h_crit_bisection = critical_bandwidth_m_modes(self.data, m)
+            t2 = time.time()
+            print("Speedup for exact critical bandwidth: {}".format((t2-t1)/(t1-t0)))
+            self.assertAlmostEqual(h_crit, h_crit_bisection, delta=1e-3)
+
+        data = np.hstack([np.random.randn(150), np.random.randn(50)+3.5])
+        x = np.linspace(np.min(data), np.max(data), 100001)
+
+        def nbr_modes(h):
+            y = np.zeros(len(x))
+            for x_i in data:
+                y += np.exp(-(x-x_i)**2/(2*h**2))
+            y = np.hstack([0, y, 0])
+            return np.sum((y[1:-1] > y[:-2]) & (y[1:-1] > y[2:]))
+
+        for m in [1, 2]:
+            h_crit = critical_bandwidth_exact(data, m)
+            self.assertTrue(nbr_modes(h_crit*(1-1e-6)) > m)
+            self.assertTrue(nbr_modes(h_crit*(1+1e-6)) <= m)
+
+        # unsorted data, mode at end of I
+        rs = np.random.RandomState(40)
+        data = rs.permutation(np.hstack([rs.randn(150), rs.randn(100)+3.5, rs.randn(100)+7]))
+        I = (0.5, 5)
+        self.assertAlmostEqual(critical_bandwidth_exact(data, 1, I),
+                               critical_bandwidth_exact(np.sort(data), 1, I), places=10)
+
+    def test_is_unimodal_kde_batch(self):
+        rs = np.random.RandomState(0)
+        resamples = np.hstack([rs.randn(200, 1000), rs.randn(200, 500)+2.5])
+        for I in [(-np.inf, np.inf), (-1.5, 4)]:
+            for h in [0.2, 0.3, 0.4]:
+                t0 = time.time()
+                unimodal = is_unimodal_kde_batch(h, resamples, I)
+                t1 = time.time()
+                unimodal_ref = [is_unimodal_kde(h, resample, I) for resample in resamples]
+                t2 = time.time()
+                self.assertTrue(np.mean(unimodal != unimodal_ref) <= 0.01)
+            print("Speedup for batched unimodality check: {}".format((t2-t1)/(t1-t0)))
+        at_most_two = kde_has_at_most_m_modes_batch(0.2, resamples, 2)
+        at_most_two_ref = [kde_has_at_most_m_modes(0.2, resample, 2) for resample in resamples]
+        self.assertTrue(np.mean(at_most_two != at_most_two_ref) <= 0.01)
+
+
+if __name__ == '__main__':
+    unittest.main()
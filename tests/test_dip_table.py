@@ -0,0 +1,73 @@
+from __future__ import unicode_literals
+from __future__ import print_function
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import numpy as np
+
+from modality.calibration import compute_dip_table, merge_dip_tables
+from modality.calibration.dip_table import load_checkpoint, save_checkpoint
+from modality.diptest import DipPvalInterpolator, load_dip_table
+
+
+class TestDipTable(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.Ns = [20, 50, 200]
+        self.kwargs = dict(B=300, chunk=40, seed=17)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_compute_dip_table(self):
+        table_file = os.path.join(self.tmpdir, 'table.npy')
+        t0 = time.time()
+        Ns, ps, diptable = compute_dip_table(self.Ns, table_file, **self.kwargs)
+        t1 = time.time()
+        _, _, diptable_pool = compute_dip_table(self.Ns, n_jobs=2, **self.kwargs)
+        t2 = time.time()
+        print("Time for dip table with one process = {}".format(t1-t0))
+        print("Time for dip table with two processes = {}".format(t2-t1))
+        self.assertTrue(np.array_equal(diptable, diptable_pool))
+        self.assertTrue(np.all(np.diff(diptable, axis=1) >= 0))
+        for table, table_loaded in zip((Ns, ps, diptable), load_dip_table(table_file)):
+            self.assertTrue(np.array_equal(table, table_loaded))
+
+        # p-values at the tabulated quantiles
+        interpolator = DipPvalInterpolator(Ns, ps, diptable)
+        j = np.nonzero(ps == 0.5)[0][0]
+        self.assertAlmostEqual(interpolator(diptable[1, j], Ns[1]), 0.5)
+
+    def test_checkpoint(self):
+        checkpoint_file = os.path.join(self.tmpdir, 'checkpoint.npz')
+        _, _, diptable = compute_dip_table(self.Ns, checkpoint_file=checkpoint_file,
+                                           **self.kwargs)
+        seed, dips, done = load_checkpoint(checkpoint_file, self.Ns, 300, 40)
+        self.assertTrue(np.all(done))
+        dips[:, 80:] = np.nan
+        done[:, 2:] = False
+        save_checkpoint(checkpoint_file, self.Ns, 300, 40, seed, dips, done)
+        _, _, diptable_resumed = compute_dip_table(
+            self.Ns, checkpoint_file=checkpoint_file, **self.kwargs)
+        self.assertTrue(np.array_equal(diptable, diptable_resumed))
+        self.assertRaises(ValueError, compute_dip_table, self.Ns,
+                          checkpoint_file=checkpoint_file, B=200, chunk=40)
+
+    def test_merge_dip_tables(self):
+        ps = np.array([0, 0.5, 1])
+        table1 = (np.array([10, 100]), ps, np.array([[1., 2, 3], [4, 5, 6]]))
+        table2 = (np.array([50, 100, 1000]), ps, np.array([[7., 8, 9], [0, 0, 0], [1, 1, 1]]))
+        Ns, ps_merged, diptable = merge_dip_tables(table1, table2)
+        self.assertTrue(np.array_equal(Ns, [10, 50, 100, 1000]))
+        self.assertTrue(np.array_equal(diptable[:, 0], [1, 7, 4, 1]))
+        self.assertRaises(ValueError, merge_dip_tables, table1,
+                          (table2[0], np.array([0, 0.4, 1]), table2[2]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,308 @@
+from __future__ import unicode_literals
+from __future__ import print_function
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import numpy as np
+from scipy.stats import kstest
+
+from modality import diptest
+from modality.util import QuantileSketch, SortedData
+
+
+class TestDiptest(unittest.TestCase):
+
+    def setUp(self):
+        self.datasets = [np.random.randn(1000),
+                         np.hstack([np.random.randn(500), np.random.randn(300)+3]),
+                         np.round(3*np.random.randn(1000)),
+                         np.random.exponential(size=1000)]
+
+    def use_synthetic_dip_table(self):
+        '''
+        Replace the tabulated p-values (qDiptab.csv may be missing) by
+        a table with dip quantiles (0.3 + 0.2*p)/sqrt(N) until the end
+        of the test.
+        '''
+        Ns = np.array([4, 10, 100, 1000, 10000])
+        ps = np.linspace(0, 1, 11)
+        interpolator = diptest._dip_pval_interpolator
+        self.addCleanup(setattr, diptest, '_dip_pval_interpolator', interpolator)
+        diptest._dip_pval_interpolator = diptest.DipPvalInterpolator(
+            Ns, ps, (0.3 + 0.2*ps[np.newaxis, :])/np.sqrt(Ns[:, np.newaxis]))
+
+    def test_linear_engine(self):
+        for data in self.datasets:
+            xF, yF = diptest.cum_distr(data)
+            t0 = time.time()
+            dip, (xU, yU) = diptest.dip_and_closest_unimodal_from_cdf(xF, yF)
+            t1 = time.time()
+            dip_lin, (xU_lin, yU_lin) = diptest.dip_and_closest_unimodal_from_cdf_linear(xF, yF)
+            t2 = time.time()
+            self.assertAlmostEqual(dip, dip_lin, places=12)
+            x = np.linspace(xF[0], xF[-1], 1000)
+            self.assertTrue(np.allclose(np.interp(x, xU, yU), np.interp(x, xU_lin, yU_lin)))
+
+            print("Speedup for linear dip engine: {}".format((t1-t0)/(t2-t1)))
+
+    def test_dip_workspace(self):
+        workspace = diptest.DipWorkspace()
+        for data in self.datasets:
+            data_sort = np.sort(data)
+            xF, yF = diptest.cum_distr(data_sort, is_sorted=True)
+            iGfin = [np.array([0])]
+            iHfin = [np.array([len(xF)-1])]
+            D = diptest.twice_dip_linear(xF, yF, iGfin=iGfin, iHfin=iHfin)
+            self.assertEqual(diptest.twice_dip_workspace(xF, yF, workspace), D)
+            iGfin_ws, iHfin_ws = workspace.final_hulls()
+            self.assertTrue(np.array_equal(iGfin_ws, np.hstack(iGfin)))
+            self.assertTrue(np.array_equal(iHfin_ws, np.hstack(iHfin[::-1])))
+            self.assertEqual(diptest.dip_sorted_workspace(data_sort, workspace), D/2)
+        xF = workspace.xF
+        diptest.dip_sorted_workspace(np.sort(self.datasets[0][:100]), workspace)
+        self.assertIs(workspace.xF, xF)
+
+        samples = np.sort(np.random.randn(500, 1000), axis=1)
+        t0 = time.time()
+        dips = diptest.dip_batch(samples, 'hull', is_sorted=True)
+        t1 = time.time()
+        dips_ws = diptest.dip_batch(samples, 'linear', is_sorted=True)
+        t2 = time.time()
+        self.assertTrue(np.allclose(dips, dips_ws))
+        print("Speedup for dip_batch with workspace: {}".format((t1-t0)/(t2-t1)))
+
+    def test_hull(self):
+        x = np.sort(np.random.rand(100000))
+        y = np.sqrt(x)
+        t0 = time.time()
+        ind = diptest.least_concave_majorant_sorted(x, y)
+        t1 = time.time()
+        self.assertTrue(np.allclose(np.interp(x, x[ind], y[ind]), y))
+        xF, yF = diptest.cum_distr(self.datasets[2])
+        ind = diptest.greatest_convex_minorant_sorted(xF, yF)
+        self.assertTrue(np.all(np.interp(xF[:-2], xF[ind], yF[ind]) <= yF[:-2] + 1e-12))
+        self.assertRaises(ValueError, diptest.least_concave_majorant_sorted,
+                          np.array([0., 1, 1, 1, 2]), np.arange(5.))
+
+        print("Least concave majorant of concave curve with {} points: {}".format(len(x), t1-t0))
+
+    def test_hull_without_numba(self):
+        numba_available = diptest.numba_available
+        diptest.numba_available = lambda: False
+        try:
+            for data in self.datasets:
+                xF, yF = diptest.cum_distr(data)
+                t0 = time.time()
+                dip_numpy = diptest.dip_from_cdf(xF, yF)
+                iG = diptest.greatest_convex_minorant_sorted(xF, yF)
+                iH = diptest.least_concave_majorant_sorted(xF, yF)
+                t1 = time.time()
+                self.assertRaises(ValueError, diptest.least_concave_majorant_sorted,
+                                  np.array([0., 1, 1, 1, 2]), np.arange(5.))
+                diptest.numba_available = numba_available
+                self.assertAlmostEqual(diptest.dip_from_cdf(xF, yF), dip_numpy, places=12)
+                self.assertTrue(np.all(diptest.greatest_convex_minorant_sorted(xF, yF) == iG))
+                self.assertTrue(np.all(diptest.least_concave_majorant_sorted(xF, yF) == iH))
+                diptest.numba_available = lambda: False
+                print("Dip with NumPy hull, {} points: {}".format(len(xF), t1-t0))
+        finally:
+            diptest.numba_available = numba_available
+
+    def test_linear_engine_without_numba(self):
+        data = self.datasets[1]
+        xF, yF = diptest.cum_distr(data)
+        sorted_data = SortedData(data)
+        subsets = [np.random.rand(len(data)) < 0.5 for i in range(5)]
+        dips_ref = diptest.dip_subsets(sorted_data, subsets)[0]
+        numba_available = diptest.numba_available
+        diptest.numba_available = lambda: False
+        self.use_synthetic_dip_table()
+        try:
+            for engine in diptest.dip_engines:
+                if engine == 'linear':
+                    self.assertRaises(ImportError, diptest.dip_from_cdf, xF, yF, engine=engine)
+                    self.assertRaises(ImportError, diptest.dip_batch, data[np.newaxis, :], engine)
+                    self.assertRaises(ImportError, diptest.DipWorkspace, len(data))
+                else:
+                    diptest.dip_from_cdf(xF, yF, engine=engine)
+            self.assertEqual(diptest.default_dip_engine(), 'hull')
+            self.assertAlmostEqual(diptest.dip_batch(data[np.newaxis, :])[0],
+                                   diptest.dip_from_cdf(xF, yF))
+            t0 = time.time()
+            dips = diptest.dip_subsets(sorted_data, subsets)[0]
+            t1 = time.time()
+            self.assertTrue(np.allclose(dips, dips_ref))
+            monitor = diptest.WindowedDipMonitor(500)
+            monitor.update(data[:500])
+            self.assertAlmostEqual(monitor.dip, diptest.dip_from_cdf(*diptest.cum_distr(data[:500])))
+        finally:
+            diptest.numba_available = numba_available
+        print("Time for dips of 5 subsets without numba: {}".format(t1-t0))
+
+    def test_cum_distr(self):
+        data = self.datasets[2]
+        w = np.random.rand(len(data))
+        xF, yF = diptest.cum_distr(data, w)
+        values = np.unique(data)
+        self.assertTrue(np.array_equal(xF, np.repeat(values, 2)))
+        w_values = np.array([np.sum(w[data == value]) for value in values])
+        self.assertTrue(np.allclose(yF[1::2], np.cumsum(w_values)/np.sum(w)))
+        ord = np.argsort(data)
+        xF_sorted, yF_sorted = diptest.cum_distr(data[ord], w[ord], is_sorted=True)
+        self.assertTrue(np.array_equal(xF, xF_sorted))
+        self.assertTrue(np.allclose(yF, yF_sorted))
+
+    def test_cum_distr_from_counts(self):
+        data = self.datasets[2]
+        values, counts = np.unique(data, return_counts=True)
+        values = np.hstack([values, [100.]])
+        counts = np.hstack([counts, [0]])
+        perm = np.random.permutation(len(values))
+        xF, yF = diptest.cum_distr(data)
+        xF_counts, yF_counts = diptest.cum_distr_from_counts(values[perm], counts[perm])
+        self.assertTrue(np.array_equal(xF, xF_counts))
+        self.assertTrue(np.allclose(yF, yF_counts))
+        for engine in diptest.dip_engines:
+            self.assertAlmostEqual(diptest.dip_from_cdf(xF, yF, engine=engine),
+                                   diptest.dip_from_cdf(xF_counts, yF_counts, engine=engine))
+        self.assertRaises(ValueError, diptest.cum_distr_from_counts, values, -counts)
+
+    def test_dip_from_sketch(self):
+        for data in self.datasets:
+            data = np.hstack([data]*20)
+            sketch = QuantileSketch(k=1000)
+            for chunk in np.array_split(data, 7):
+                sketch.update(chunk)
+            dip, dip_error = diptest.dip_from_sketch(sketch)
+            dip_data = diptest.dip_from_cdf(*diptest.cum_distr(data))
+            self.assertTrue(dip_error > 0)
+            self.assertTrue(abs(dip-dip_data) <= dip_error)
+
+    def test_hartigan_diptest_columns(self):
+        X = np.random.randn(300, 40)
+        X[:, ::3] += 3*(np.random.rand(300, 14) < 0.4)
+        dips = np.array([diptest.dip_from_cdf(*diptest.cum_distr(x)) for x in X.T])
+        self.use_synthetic_dip_table()
+        t0 = time.time()
+        dips_col, pvals = diptest.hartigan_diptest_columns(X)
+        t1 = time.time()
+        dips_par, pvals_par = diptest.hartigan_diptest_columns(X.T, axis=1, n_jobs=2)
+        t2 = time.time()
+        pvals_ref = diptest.dip_pval_tabinterpol(dips, X.shape[0])
+        print("Time for dip test of columns with one process = {}".format(t1-t0))
+        print("Time for dip test of columns with two processes = {}".format(t2-t1))
+        self.assertTrue(np.allclose(dips_col, dips))
+        self.assertTrue(np.allclose(dips_par, dips))
+        self.assertTrue(np.allclose(pvals, pvals_ref))
+        self.assertTrue(np.allclose(pvals_par, pvals_ref))
+
+    def test_hartigan_diptest_subsets(self):
+        data = self.datasets[1]
+        sorted_data = SortedData(data)
+        masks = np.random.rand(30, len(data)) < np.linspace(0.1, 0.9, 30)[:, np.newaxis]
+        dips_ref = np.array([diptest.dip_from_cdf(*diptest.cum_distr(data[mask]))
+                             for mask in masks])
+        self.use_synthetic_dip_table()
+        t0 = time.time()
+        dips, pvals = diptest.hartigan_diptest_subsets(sorted_data, masks)
+        t1 = time.time()
+        pvals_ref = diptest.dip_pval_tabinterpol(dips_ref, np.sum(masks, axis=1))
+        print("Time for dip test of 30 subsets = {}".format(t1-t0))
+        self.assertTrue(np.allclose(dips, dips_ref))
+        self.assertTrue(np.allclose(pvals, pvals_ref))
+        subsets = [np.nonzero(mask)[0] for mask in masks[:5]] + list(masks[5:10])
+        for engine in diptest.dip_engines:
+            dips_sub, Ns_sub = diptest.dip_subsets(sorted_data, subsets, engine)
+            self.assertTrue(np.allclose(dips_sub, dips_ref[:10]))
+            self.assertTrue(np.array_equal(Ns_sub, np.sum(masks[:10], axis=1)))
+
+    def test_windowed_dip_monitor(self):
+        W = 5000
+        stream = np.hstack([np.round(np.random.randn(15000), 2),
+                            np.round(np.random.randn(15000) + 4*(np.random.rand(15000) < 0.5), 2)])
+        self.use_synthetic_dip_table()
+        monitor = diptest.WindowedDipMonitor(W, alpha=0.05)
+        t0 = time.time()
+        pvals = [monitor.update(events) for events in np.array_split(stream, 1200)]
+        t1 = time.time()
+        stops = np.cumsum([len(events) for events in np.array_split(stream, 1200)])
+        for stop, (pval, pval_lower, pval_upper) in list(zip(stops, pvals))[::20]:
+            window = stream[max(stop-W, 0):stop]
+            pval_window = diptest.dip_pval_tabinterpol(
+                diptest.dip_from_cdf(*diptest.cum_distr(window)), len(window))
+            self.assertTrue(pval_lower - 1e-12 <= pval_window <= pval_upper + 1e-12)
+            self.assertEqual(pval_lower < 0.05, pval_upper < 0.05)
+        self.assertTrue(np.array_equal(monitor.window_sort, np.sort(stream[-W:])))
+        self.assertTrue(monitor.recompute()[0] < 0.05)
+        self.assertEqual(monitor.dip_error, 0)
+        print("Time for windowed dip test of {} events = {}, dip computed {} times".format(
+            len(stream), t1-t0, monitor.nbr_computations))
+        # 200 computations while the window fills up
+        self.assertTrue(monitor.nbr_computations < 500)
+
+    def test_dip_batch(self):
+        samples = np.random.randn(20, 500)
+        dips = [diptest.dip_from_cdf(*diptest.cum_distr(data)) for data in samples]
+        for engine in list(diptest.dip_engines) + [None]:
+            self.assertTrue(np.allclose(diptest.dip_batch(samples, engine), dips))
+
+    def test_sample_from_unimod(self):
+        xF, yF = diptest.cum_distr(self.datasets[1])
+        dip, (xU, yU) = diptest.dip_and_closest_unimodal_from_cdf(xF, yF)
+        samples = diptest.sample_from_unimod_batch((xU, yU), 1000, 50)
+        self.assertEqual(samples.shape, (50, 1000))
+        self.assertTrue(np.all(np.diff(samples, axis=1) >= 0))
+        pval = kstest(samples.ravel(), lambda x: np.interp(x, xU, yU)).pvalue
+        self.assertTrue(pval > 1e-4)
+
+    def test_dip_pval_interpolator(self):
+        Ns = np.array([4, 10, 100, 1000, 10000])
+        ps = np.linspace(0, 1, 11)
+        diptable = (0.3 + 0.2*ps[np.newaxis, :])/np.sqrt(Ns[:, np.newaxis])
+        interpolator = diptest.DipPvalInterpolator(Ns, ps, diptable)
+        dips = np.random.rand(200)*0.05
+        N = np.random.choice([5, 50, 500, 5000, 50000], 200)
+        pvals = interpolator(dips, N)
+        self.assertTrue(np.allclose(pvals, [interpolator(dip, n) for dip, n in zip(dips, N)],
+                                    equal_nan=True))
+        self.assertTrue(np.all(np.isnan(pvals[N < 10])))
+        self.assertEqual(interpolator(0, 100), 1)
+        self.assertEqual(interpolator(1, 100), 0)
+        self.assertAlmostEqual(interpolator(0.4/np.sqrt(100), 100), 0.5)
+        self.assertAlmostEqual(interpolator(0.4/np.sqrt(40000), 40000), 0.5)
+
+    def test_dip_table(self):
+        Ns = np.array([4, 10, 100, 1000])
+        ps = np.array([0, 0.01, 0.5, 0.99, 1])
+        diptable = np.random.rand(len(Ns), len(ps))
+        tmpdir = tempfile.mkdtemp()
+        try:
+            csv_file = os.path.join(tmpdir, 'qDiptab.csv')
+            npy_file = os.path.join(tmpdir, 'qDiptab.npy')
+            with open(csv_file, 'w') as f:  # format of R's write.csv
+                f.write(','.join(['""'] + ['"{!r}"'.format(p) for p in ps]) + '\n')
+                for N, row in zip(Ns, diptable):
+                    f.write(','.join(['"{}"'.format(N)] + [repr(d) for d in row]) + '\n')
+            diptest.convert_dip_table(csv_file, npy_file)
+            Ns_csv, ps_csv, diptable_csv = diptest.read_dip_table_csv(csv_file)
+            Ns_npy, ps_npy, diptable_npy = diptest.load_dip_table(npy_file)
+            self.assertIsInstance(diptable_npy, np.memmap)
+            for table in [(Ns_csv, ps_csv, diptable_csv), (Ns_npy, ps_npy, diptable_npy)]:
+                self.assertTrue(np.array_equal(table[0], Ns))
+                self.assertTrue(np.array_equal(table[1], ps))
+                self.assertTrue(np.array_equal(table[2], diptable))
+            del Ns_npy, ps_npy, diptable_npy
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_unknown_engine(self):
+        xF, yF = diptest.cum_distr(self.datasets[0])
+        self.assertRaises(ValueError, diptest.dip_from_cdf, xF, yF, engine='unknown')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+from __future__ import unicode_literals
+from __future__ import print_function
+
+import json
+import os
+import subprocess
+import sys
+import unittest
+
+
+IMPORT_SCRIPT = '''
+import json, sys, time
+import numpy, scipy.optimize, scipy.signal, scipy.special, scipy.stats
+t0 = time.time()
+import modality
+t1 = time.time()
+print(json.dumps({'time': t1-t0, 'modules': sorted(sys.modules),
+                  'qDiptab_loaded': modality.diptest._dip_pval_interpolator is not None}))
+'''
+
+
+class TestImport(unittest.TestCase):
+    '''
+        Startup benchmark: importing modality in a fresh interpreter
+        should not import optional or plotting dependencies, load MPI
+        or read the dip table, and should stay within an import-time
+        budget on top of the time for importing numpy and scipy.
+    '''
+
+    time_budget = 0.5  # seconds
+    deferred_modules = ['mpi4py', 'matplotlib', 'pandas', 'sklearn',
+                        'pkg_resources', 'numba']
+
+    def test_import(self):
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        env = dict(os.environ)
+        env['PYTHONPATH'] = os.pathsep.join(
+            [root] + ([env['PYTHONPATH']] if 'PYTHONPATH' in env else []))
+        out = subprocess.check_output([sys.executable, '-c', IMPORT_SCRIPT],
+                                      env=env)
+        res = json.loads(out.decode('utf-8').strip().split('\n')[-1])
+        print("Time for import modality = {}".format(res['time']))
+        for module in self.deferred_modules:
+            self.assertNotIn(module, res['modules'])
+        self.assertFalse(res['qDiptab_loaded'])
+        self.assertLess(res['time'], self.time_budget)
+
+
+if __name__ == '__main__':
+    unittest.main()
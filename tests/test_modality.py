@@ -8,7 +8,7 @@ import numpy as np
 # from mpi4py import MPI
 
 from modality import calibrated_diptest, calibrated_bwtest, silverman_bwtest, \
-    hartigan_diptest, excess_mass_modes
+    hartigan_diptest, excess_mass_modes, calibrated_diptest_counts
 from modality.util import auto_interval
 
 
@@ -39,6 +39,20 @@ class testModality(unittest.TestCase):
         print("Adaptive sampling diptest: {}, {}".format(t1-t0, t2-t1))
         print("Non-adaptive sampling diptest: {}, {}".format(t4-t3, t3-t2))
 
+    def test_calibrated_diptest_counts(self):
+        data = np.round(self.data*10)/10
+        values, counts = np.unique(data, return_counts=True)
+        np.random.seed(5)
+        pval = calibrated_diptest(data, self.alpha, 'normal', adaptive_resampling=False,
+                                  N_non_adaptive=200)
+        np.random.seed(5)
+        t0 = time.time()
+        pval_counts = calibrated_diptest_counts(values, counts, self.alpha, 'normal',
+                                                adaptive_resampling=False, N_non_adaptive=200)
+        t1 = time.time()
+        print("Non-adaptive sampling diptest from counts: {}".format(t1-t0))
+        self.assertEqual(pval, pval_counts)
+
     def test_calibrated_bwtest(self):
         t0 = time.time()
         calibrated_bwtest(self.data, self.alpha, 'shoulder', self.I, adaptive_resampling=True)
@@ -5,7 +5,9 @@ import numpy as np
 from sklearn.neighbors import KernelDensity
 import time
 
-from modality.util import ApproxGaussianKDE, auto_interval, fp_blurring
+from modality.util import ApproxGaussianKDE, auto_interval, fp_blurring, QuantileSketch, \
+    SortedData, SortedBlocks, FFTGaussianKDE, BinningPyramid, TruncatedGaussianKDE, FastGaussTransformKDE, \
+    smoothed_bootstrap
 
 
 class TestUtil(unittest.TestCase):
@@ -51,5 +53,159 @@ class TestUtil(unittest.TestCase):
         self.assertTrue(np.max(np.abs(data_blurred-data_trunc)) <= 0.5*w)
 
 
+    def test_truncated_KDE(self):
+        tol = 1e-4
+        data = np.hstack([np.random.randn(20000), np.random.randn(10000)+10])
+        for h in [0.05, 0.5]:
+            kde = ApproxGaussianKDE(data, h, tol)
+            kde_trunc = TruncatedGaussianKDE(data, h, tol)
+            for M in [20, 5000]:
+                x = np.random.uniform(-4, 14, M)
+                t0 = time.time()
+                y = kde.evaluate(x)
+                t1 = time.time()
+                y_trunc = kde_trunc.evaluate(x)
+                t2 = time.time()
+                self.assertTrue(np.max(np.abs(y-y_trunc)) <= tol/(h*np.sqrt(2*np.pi)))
+                print("Speedup for truncated KDE with h = {} and {} points: {}".format(
+                    h, M, (t1-t0)/(t2-t1)))
+
+    def test_FFT_KDE(self):
+        tol = 1e-4
+        for N in [10, 1000, 10000]:
+            data = np.hstack([np.random.randn(N//2), np.random.randn(N-N//2)/10+3])
+            x = np.linspace(-4, 5, 1000)
+            for h in [0.01, 0.1, 1]:
+                kde = FFTGaussianKDE(data, h, tol)
+                t0 = time.time()
+                y_fft = kde.evaluate(x)
+                t1 = time.time()
+                y = np.mean(np.exp(-(x[:, np.newaxis]-data)**2/(2*h**2)), axis=1)/(h*np.sqrt(2*np.pi))
+                self.assertTrue(np.max(np.abs(y_fft-y)) <= tol/(h*np.sqrt(2*np.pi)))
+                self.assertAlmostEqual(kde.distr(1.), np.mean(data < 1.), delta=0.02+h)
+            print("Time for FFT KDE evaluation with {} data points: {}".format(N, t1-t0))
+
+    def test_fast_gauss_transform_KDE(self):
+        tol = 1e-4
+        data = np.hstack([np.random.randn(5000), np.random.randn(2500)+6])
+        x = np.random.uniform(-4, 10, 2000)
+        for h in [0.01, 0.1, 1]:
+            t0 = time.time()
+            kde = FastGaussTransformKDE(data, h, tol)
+            y_fgt = kde.evaluate(x)
+            t1 = time.time()
+            y = np.mean(np.exp(-(x[:, np.newaxis]-data)**2/(2*h**2)), axis=1)/(h*np.sqrt(2*np.pi))
+            t2 = time.time()
+            self.assertTrue(np.max(np.abs(y_fgt-y)) <= tol/(h*np.sqrt(2*np.pi)))
+            print("Speedup for fast Gauss transform with h = {}: {}".format(h, (t2-t1)/(t1-t0)))
+        self.assertAlmostEqual(kde.distr(3.), ApproxGaussianKDE(data, h).distr(3.), delta=1e-4)
+
+    def test_KDE_distr(self):
+        from scipy.stats import norm
+        data = np.hstack([np.random.randn(20000), np.random.randn(5000)/4+3])
+        x = np.linspace(-5, 5, 200)
+        for h in [0.01, 0.1, 1]:
+            F = np.mean(norm.cdf(x[:, np.newaxis]-data, scale=h), axis=1)
+            for kde in [ApproxGaussianKDE(data, h), FFTGaussianKDE(data, h),
+                        FastGaussTransformKDE(data, h)]:
+                t0 = time.time()
+                F_kde = kde.distr(x)
+                t1 = time.time()
+                self.assertEqual(F_kde.shape, x.shape)
+                self.assertTrue(np.max(np.abs(F_kde-F)) < 1e-3)
+                self.assertAlmostEqual(kde.distr(x[100]), F_kde[100])
+            print("Time for distribution function of KDE at {} points with h = {}: {}".format(
+                len(x), h, t1-t0))
+
+    def test_smoothed_bootstrap(self):
+        data = np.hstack([np.random.randn(2000), np.random.randn(1000)+4])
+        h = 0.5
+        B = 200
+        t0 = time.time()
+        samples = smoothed_bootstrap(data, h, B)
+        t1 = time.time()
+        KD = KernelDensity(kernel='gaussian', bandwidth=h).fit(data.reshape(-1, 1))
+        for _ in range(B):
+            KD.sample(len(data))
+        t2 = time.time()
+        print("Speedup for smoothed bootstrap vs. KernelDensity.sample: {}".format((t2-t1)/(t1-t0)))
+        self.assertEqual(samples.shape, (B, len(data)))
+        self.assertAlmostEqual(np.var(samples), np.var(data), delta=0.02*np.var(data))
+        self.assertAlmostEqual(np.mean(samples)*np.sqrt(1+h**2/np.var(data)), np.mean(data), delta=0.02)
+        samples32 = smoothed_bootstrap(data, h, B, 100, dtype=np.float32)
+        self.assertEqual(samples32.shape, (B, 100))
+        self.assertEqual(samples32.dtype, np.float32)
+        self.assertAlmostEqual(np.var(samples32), np.var(data), delta=0.05*np.var(data))
+
+    def test_binning_pyramid(self):
+        data = np.hstack([np.random.randn(50000), np.random.randn(50000)+4])
+        pyramid = BinningPyramid(data, nbr_levels=12)
+        for k, (means, counts) in enumerate(pyramid.levels):
+            self.assertEqual(np.sum(counts), len(data))
+            self.assertTrue(np.allclose(np.sum(means*counts), np.sum(data)))
+            if k < pyramid.nbr_levels:
+                self.assertEqual(pyramid.level(pyramid.bin_width(k)*1.5), k)
+        self.assertIsNone(pyramid.level(pyramid.w0/2))
+        x = np.linspace(-3, 7, 500)
+        for h in [0.01, 0.1, 1]:
+            kde = ApproxGaussianKDE(data, h)
+            for kde_pyr in [ApproxGaussianKDE.from_pyramid(pyramid, h),
+                            FFTGaussianKDE.from_pyramid(pyramid, h)]:
+                self.assertTrue(np.max(np.abs(kde_pyr.evaluate(x)-kde.evaluate(x)))
+                                <= 2e-4/(h*np.sqrt(2*np.pi)))
+
+    def test_quantile_sketch(self):
+        data = np.hstack([np.random.randn(150000), np.round(np.random.randn(50000)+3, 1)])
+        np.random.shuffle(data)
+        chunks = np.split(data, [1000, 30000, 31000, 120000])
+        sketches = [QuantileSketch(k=500).update(chunk) for chunk in chunks[:3]]
+        sketches[0].update(chunks[3]).update(chunks[4])
+        sketch = sketches[0].merge(sketches[1].merge(sketches[2]))
+        items, weights = sketch.items_and_weights()
+        self.assertEqual(sketch.n, len(data))
+        self.assertEqual(np.sum(weights), len(data))
+        self.assertTrue(len(items) < 0.01*len(data))
+
+        # rank error at all data points
+        data_sort = np.sort(data)
+        ord = np.argsort(items)
+        weight_below = np.hstack([0, np.cumsum(weights[ord])])
+        for side in ['left', 'right']:
+            rank = np.searchsorted(data_sort, data_sort, side)
+            rank_sketch = weight_below[np.searchsorted(items[ord], data_sort, side)]
+            self.assertTrue(np.max(np.abs(rank-rank_sketch)) <= sketch.rank_error)
+        print("Sketch cdf error bound = {}".format(sketch.cdf_error))
+
+    def test_sorted_data(self):
+        data = np.round(np.random.randn(10000), 2)
+        sorted_data = SortedData(data)
+        mask = np.random.rand(len(data)) < 0.3
+        self.assertTrue(np.array_equal(sorted_data.subset(mask), np.sort(data[mask])))
+        for k in [0, 1, 50, 5000]:
+            ind = np.random.randint(len(data), size=k)
+            self.assertTrue(np.array_equal(sorted_data.subset(ind), np.sort(data[ind])))
+        masks = np.random.rand(5, len(data)) < 0.5
+        for mask, mask_sorted in zip(masks, sorted_data.sorted_masks(masks)):
+            self.assertTrue(np.array_equal(sorted_data.data_sort[mask_sorted],
+                                           np.sort(data[mask])))
+        self.assertRaises(ValueError, sorted_data.subset, mask[1:])
+
+    def test_sorted_blocks(self):
+        sorted_blocks = SortedBlocks(block_size=4)
+        values = np.zeros(0)
+        for _ in range(200):
+            added = np.round(np.random.randn(np.random.randint(10)), 1)
+            sorted_blocks.insert(added)
+            values = np.hstack([values, added])
+            ind = np.random.choice(len(values), np.random.randint(len(values)//2+1), replace=False)
+            sorted_blocks.remove(values[ind])
+            values = np.sort(np.delete(values, ind))
+            self.assertTrue(np.array_equal(sorted_blocks.to_array(), values))
+            self.assertEqual(len(sorted_blocks), len(values))
+            self.assertTrue(all(len(blk) <= 8 for blk in sorted_blocks.blocks))
+        self.assertRaises(ValueError, sorted_blocks.remove, [100.])
+        self.assertTrue(np.array_equal(sorted_blocks.to_array(), values))
+
+
 if __name__ == '__main__':
     unittest.main()